@@ -0,0 +1,112 @@
+import datetime
+import json
+import queue
+import sys
+import threading
+import time
+
+from flask import g, request
+
+from hashing import keyed_hash, new_salt
+
+_FLUSH = object()  # queued by flush() to make the writer write a partial batch
+
+
+class AccessLog:
+    """Structured JSON access log written by a background thread
+
+    Request threads only build a small dict and put it on a bounded queue;
+    hashing, JSON encoding and I/O happen on the writer thread, which
+    writes records in batches. When the queue is full records are dropped
+    (and counted) rather than making a request wait.
+    """
+
+    def __init__(self, app, stream, caller_of, salt=None, batch_size=256, flush_interval=0.5, max_queue=10000):
+        self.stream = stream
+        self.caller_of = caller_of
+        # Without a configured salt, hashes are only comparable within this process
+        self.salt = salt.encode() if salt else new_salt()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._writer = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._writer.start()
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+    def _before(self):
+        g.access_log_started = time.perf_counter()
+
+    def _after(self, response):
+        started = g.pop("access_log_started", None)
+        if started is None:
+            return response
+        phone_number, _ = self.caller_of()
+        entry = (
+            time.time(),
+            request.method,
+            request.url_rule.rule if request.url_rule else request.path,
+            response.status_code,
+            (time.perf_counter() - started) * 1000,
+            phone_number,
+            g.get("application_id"),
+        )
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+        return response
+
+    def phone_hash(self, phone_number):
+        return keyed_hash(self.salt, phone_number)
+
+    def format(self, entry):
+        timestamp, method, route, status, latency_ms, phone_number, application_id = entry
+        return json.dumps({
+            "ts": datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds"),
+            "method": method,
+            "route": route,
+            "status": status,
+            "latency_ms": round(latency_ms, 3),
+            "phone_hash": self.phone_hash(phone_number),
+            "application_id": application_id,
+        }, separators=(",", ":"))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _FLUSH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            entries = [entry for entry in batch if entry is not _FLUSH]
+            if entries:
+                self.write(entries)
+            for _ in batch:
+                self._queue.task_done()
+
+    def write(self, batch):
+        lines = "".join(self.format(entry) + "\n" for entry in batch)
+        try:
+            self.stream.write(lines)
+            self.stream.flush()
+        except (OSError, ValueError) as error:
+            print(f"Access log write failed: {error}", file=sys.stderr)
+
+    def flush(self, timeout=None):
+        """Write any partial batch and block until every queued record has been written (for tests and shutdown)"""
+        self._queue.put(_FLUSH)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
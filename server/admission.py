@@ -0,0 +1,174 @@
+import math
+import threading
+import time
+
+# Share of max_in_flight normal and low requests may fill, and how long a
+# request may have waited since it arrived before it is shed. Critical
+# requests have reserved slots of their own, so they never queue behind
+# slow normal work.
+PRIORITY_SHARE = {"normal": 1.0, "low": 0.5}
+PRIORITY_MAX_WAIT = {"critical": 1.0, "normal": 0.1, "low": 0.05}
+CRITICAL_SLOTS_SHARE = 0.5  # reserved critical slots, relative to max_in_flight
+DELAY_HALF_LIFE = 1.0  # seconds for the queueing-delay average to halve when idle
+
+
+def parse_request_start(value, now=None):
+    """Seconds a request waited before reaching the app, from an X-Request-Start value
+
+    Front proxies stamp arrival as "t=<time since the epoch>" in seconds
+    (nginx), milliseconds (Heroku) or microseconds. Returns None for a
+    missing, unparseable or non-finite value; clock skew never yields a
+    negative wait.
+    """
+    try:
+        started = float(value.strip().removeprefix("t="))
+    except (AttributeError, ValueError):
+        return None
+    if not math.isfinite(started):
+        return None
+    while started > 1e11:  # milliseconds or microseconds
+        started /= 1000
+    return max(0.0, (time.time() if now is None else now) - started)
+
+
+class ArrivalStamp:
+    """WSGI middleware noting when each request reached the app, ahead of Flask's own work"""
+
+    ENVIRON_KEY = "admission.arrived"
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        environ[self.ENVIRON_KEY] = time.monotonic()
+        return self.wsgi_app(environ, start_response)
+
+
+class DecayingAverage:
+    """Exponentially weighted average that also decays towards zero over time"""
+
+    def __init__(self, weight=0.2):
+        self.weight = weight
+        self.value = 0.0
+        self._updated = time.monotonic()
+
+    def current(self, now):
+        return self.value * 0.5 ** ((now - self._updated) / DELAY_HALF_LIFE)
+
+    def add(self, sample, now):
+        self.value = self.current(now) * (1 - self.weight) + sample * self.weight
+        self._updated = now
+
+
+class RouteStats:
+
+    def __init__(self):
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.queue_delay = DecayingAverage()
+        self.service_time = DecayingAverage()
+
+
+class AdmissionController:
+    """Bounded concurrency with reserved critical slots and early load shedding
+
+    At most max_in_flight normal and low requests run at once, low ones in
+    only part of that, and critical requests run in critical_slots of their
+    own. Queueing delay is measured from each request's arrival, so a
+    request that already waited too long elsewhere (in the accept queue or
+    for a server thread) is shed rather than served late. While the average
+    queueing delay is above target_delay low-priority requests are shed on
+    arrival instead of adding to the queue.
+    """
+
+    def __init__(self, max_in_flight=64, target_delay=0.05, critical_slots=None):
+        self.max_in_flight = max_in_flight
+        self.target_delay = target_delay
+        if critical_slots is None:
+            critical_slots = max(1, round(max_in_flight * CRITICAL_SLOTS_SHARE))
+        self.critical_slots = critical_slots
+        self.in_flight = 0
+        self.critical_in_flight = 0
+        self.queue_delay = DecayingAverage()
+        self.routes = {}  # route -> RouteStats
+        self._cond = threading.Condition()
+
+    def _route(self, route):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        return stats
+
+    def _has_slot(self, priority):
+        if priority == "critical":
+            return self.critical_in_flight < self.critical_slots
+        return self.in_flight < self.max_in_flight * PRIORITY_SHARE[priority]
+
+    def admit(self, route, priority, waited=0.0):
+        """Wait for a slot and return True, or return False to shed the request
+
+        waited is how long the request had already been queued before
+        reaching the app; it counts towards the queueing delay and the
+        priority's maximum wait.
+        """
+        now = time.monotonic()
+        arrived = now - waited
+        deadline = arrived + PRIORITY_MAX_WAIT[priority]
+        with self._cond:
+            stats = self._route(route)
+            shed = priority == "low" and self.queue_delay.current(now) > self.target_delay
+            while not shed and not self._has_slot(priority) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            now = time.monotonic()
+            # Past its deadline a request is shed even if a slot is free: it is already late
+            shed = shed or now > deadline
+            self.queue_delay.add(now - arrived, now)
+            stats.queue_delay.add(now - arrived, now)
+            if shed:
+                stats.shed += 1
+                return False
+            if priority == "critical":
+                self.critical_in_flight += 1
+            else:
+                self.in_flight += 1
+            stats.in_flight += 1
+            stats.admitted += 1
+        return True
+
+    def release(self, route, priority, service_time):
+        with self._cond:
+            stats = self._route(route)
+            if priority == "critical":
+                self.critical_in_flight -= 1
+            else:
+                self.in_flight -= 1
+            stats.in_flight -= 1
+            stats.service_time.add(service_time, time.monotonic())
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """Whole seconds a shed client should wait before retrying"""
+        return max(1, math.ceil(self.queue_delay.current(time.monotonic()) * 10))
+
+    def snapshot(self):
+        """Current in-flight counts, queueing delays and shed counts per route"""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "critical_slots": self.critical_slots,
+                "critical_in_flight": self.critical_in_flight,
+                "queue_delay_ms": round(self.queue_delay.current(now) * 1000, 3),
+                "routes": {
+                    route: {
+                        "in_flight": stats.in_flight,
+                        "admitted": stats.admitted,
+                        "shed": stats.shed,
+                        "queue_delay_ms": round(stats.queue_delay.current(now) * 1000, 3),
+                        "service_time_ms": round(stats.service_time.current(now) * 1000, 3),
+                    }
+                    for route, stats in sorted(self.routes.items())
+                },
+            }
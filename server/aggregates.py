@@ -0,0 +1,157 @@
+import datetime
+import math
+import threading
+
+STATUSES = ["approved", "pending", "rejected"]
+AGE_BANDS = [(18, 24), (25, 34), (35, 44), (45, 59), (60, None)]
+REBUILD_ATTEMPTS = 3  # lock-free scans before rebuild() scans under the lock
+
+
+def age_band(application):
+    """Label the age band of the applicant on the day they submitted"""
+    try:
+        dob = datetime.datetime.strptime(application["date_of_birth"], "%Y-%m-%d").date()
+        on = datetime.datetime.fromisoformat(application["submitted_at"]).date()
+    except (KeyError, TypeError, ValueError):
+        return "unknown"
+    age = on.year - dob.year - ((on.month, on.day) < (dob.month, dob.day))
+    for low, high in AGE_BANDS:
+        if high is None and age >= low:
+            return f"{low}+"
+        if high is not None and low <= age <= high:
+            return f"{low}-{high}"
+    return "unknown"
+
+
+class PortfolioAggregates:
+    """Portfolio counters kept up to date in O(1) per application write"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writes = 0  # bumped by every write, so rebuild() can tell it raced one
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.by_status = {status: 0 for status in STATUSES}
+        self.by_loan_term = {}  # loan_term -> {"count", "total_amount"}
+        self.by_age_band = {}  # band -> count
+
+    def _apply(self, application, sign):
+        self.total += sign
+        status = application["status"]
+        self.by_status[status] = self.by_status.get(status, 0) + sign
+
+        term = self.by_loan_term.setdefault(application["loan_term"], {"count": 0, "total_amount": 0.0})
+        term["count"] += sign
+        term["total_amount"] += sign * application["loan_amount"]
+        if term["count"] == 0:
+            del self.by_loan_term[application["loan_term"]]
+
+        band = age_band(application)
+        self.by_age_band[band] = self.by_age_band.get(band, 0) + sign
+        if self.by_age_band[band] == 0:
+            del self.by_age_band[band]
+
+    def put(self, store, key, application):
+        """Write application into store, replacing and un-counting any previous one"""
+        with self._lock:
+            previous = store.get(key)
+            store[key] = application
+            if previous is not None:
+                self._apply(previous, -1)
+            self._apply(application, 1)
+            self._writes += 1
+
+    def set_status(self, store, key, status):
+        """Change the status of a stored application, moving it between counters"""
+        with self._lock:
+            application = store[key]
+            self.by_status[application["status"]] -= 1
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            application["status"] = status
+            self._writes += 1
+
+    def rebuild(self, store):
+        """Recompute every counter from the store; return whether they had drifted
+
+        The scan runs without the lock so submissions are not held up by it;
+        if a write lands meanwhile the scan is repeated, and after a few
+        tries it is finished under the lock.
+        """
+        for _ in range(REBUILD_ATTEMPTS):
+            with self._lock:
+                writes = self._writes
+            fresh = PortfolioAggregates()
+            for application in list(store.values()):
+                fresh._apply(application, 1)
+            with self._lock:
+                if self._writes == writes:
+                    return self._swap(fresh)
+        with self._lock:
+            fresh = PortfolioAggregates()
+            for application in list(store.values()):
+                fresh._apply(application, 1)
+            return self._swap(fresh)
+
+    def _swap(self, fresh):
+        consistent = snapshots_match(self._snapshot(), fresh._snapshot())
+        self.total = fresh.total
+        self.by_status = fresh.by_status
+        self.by_loan_term = fresh.by_loan_term
+        self.by_age_band = fresh.by_age_band
+        return not consistent
+
+    def snapshot(self):
+        """Return the counters as a JSON-serializable dict"""
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return {
+            "total_applications": self.total,
+            "by_status": dict(self.by_status),
+            "by_loan_term": {
+                str(loan_term): {
+                    "count": term["count"],
+                    "total_amount": term["total_amount"],
+                    "average_amount": term["total_amount"] / term["count"],
+                }
+                for loan_term, term in sorted(self.by_loan_term.items())
+            },
+            "by_age_band": dict(self.by_age_band),
+        }
+
+
+def snapshots_match(left, right):
+    """Compare two snapshots, allowing for float drift in the amount totals"""
+    if left.keys() != right.keys():
+        return False
+    for key in left:
+        if isinstance(left[key], dict):
+            if not isinstance(right[key], dict) or not snapshots_match(left[key], right[key]):
+                return False
+        elif isinstance(left[key], float):
+            if not math.isclose(left[key], right[key], rel_tol=1e-9, abs_tol=1e-6):
+                return False
+        elif left[key] != right[key]:
+            return False
+    return True
+
+
+def merge_snapshots(snapshots):
+    """Combine snapshots taken on several nodes into one portfolio view"""
+    merged = {"total_applications": 0, "by_status": {}, "by_loan_term": {}, "by_age_band": {}}
+    for snapshot in snapshots:
+        merged["total_applications"] += snapshot["total_applications"]
+        for key in ("by_status", "by_age_band"):
+            for name, count in snapshot[key].items():
+                merged[key][name] = merged[key].get(name, 0) + count
+        for loan_term, term in snapshot["by_loan_term"].items():
+            total = merged["by_loan_term"].setdefault(loan_term, {"count": 0, "total_amount": 0.0})
+            total["count"] += term["count"]
+            total["total_amount"] += term["total_amount"]
+    for term in merged["by_loan_term"].values():
+        term["average_amount"] = term["total_amount"] / term["count"]
+    merged["by_loan_term"] = dict(sorted(merged["by_loan_term"].items(), key=lambda item: int(item[0])))
+    return merged
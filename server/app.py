@@ -1,13 +1,27 @@
 import datetime
+import hmac
+import os
 import re
-from flask import Flask, request, jsonify
+import sys
+import time
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 import uuid
 
+from access_log import AccessLog
+from admission import AdmissionController, ArrivalStamp, parse_request_start
+from aggregates import PortfolioAggregates
+from capture import TrafficCapture
+from compression import compress, compress_chunks, negotiate
+from external_checks import ExternalCheckStage
+from idempotency import IdempotencyCache
+from phone import canonicalize_phone_number
+
 app = Flask(__name__)
 CORS(app)
 
 # In-memory storage (simulating a database)
+# Every store is keyed by the canonical phone number (see canonicalize_phone_number)
 users = {}  # phone_number -> user_data
 applications = {}  # phone_number -> application_data
 otp_store = {}  # phone_number -> otp
@@ -18,16 +32,37 @@ MIN_AGE = 18
 MIN_LOAN_AMOUNT = 1000
 MAX_LOAN_AMOUNT = 5000000
 ALLOWED_LOAN_TERMS = [15, 30, 45, 60]  # in days
+IDEMPOTENCY_MAX_ENTRIES = 10000
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+TRAFFIC_CAPTURE_FILE = os.environ.get("TRAFFIC_CAPTURE_FILE")  # opt-in JSONL capture
+ACCESS_LOG = os.environ.get("ACCESS_LOG", "-")  # "-" for stdout, a file path, or "off"
+ACCESS_LOG_SALT = os.environ.get("ACCESS_LOG_SALT")  # unset: random per process
+NODE_ID = os.environ.get("NODE_ID")  # set by cluster.py; prefixes session tokens
+# Bearer token for operators and the cluster router; grants the portfolio endpoints without a session
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+EXTERNAL_CHECKS = os.environ.get("EXTERNAL_CHECKS", "")  # "credit_bureau=http://...,fraud=http://..."
+EXTERNAL_CHECK_TIMEOUT = float(os.environ.get("EXTERNAL_CHECK_TIMEOUT", "0.5"))  # seconds, per check
+EXTERNAL_CHECK_CACHE_TTL = 15 * 60
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "64"))  # 0 disables shedding
+# Header in which a trusted front proxy stamps arrival, e.g. X-Request-Start; unset ignores it
+ADMISSION_REQUEST_START_HEADER = os.environ.get("ADMISSION_REQUEST_START_HEADER", "")
+# Routes kept available under overload; anything not listed is "normal"
+ROUTE_PRIORITIES = {
+    "/api/health": "critical",
+    "/api/application/status": "critical",
+    "/api/auth/request-otp": "low",
+}
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "256"))  # bytes; 0 compresses everything
 
-
-def validate_phone_number(phone):
-    """Validate phone number format"""
-    # Basic validation - should be digits and have reasonable length
-    if not phone:
-        return False
-    # Remove common prefixes and spaces
-    cleaned = phone.replace("+", "").replace(" ", "").replace("-", "")
-    return cleaned.isdigit() and len(cleaned) >= 9 and len(cleaned) <= 15
+# (phone_number, idempotency_key) -> stored submit response
+idempotency_cache = IdempotencyCache(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_SECONDS)
+# Counters over `applications`; write applications through portfolio.put/set_status
+portfolio = PortfolioAggregates()
+# Credit bureau and similar checks; no checks are configured by default
+external_checks = ExternalCheckStage.from_config(
+    EXTERNAL_CHECKS, EXTERNAL_CHECK_TIMEOUT, cache_ttl=EXTERNAL_CHECK_CACHE_TTL,
+    concurrency=ADMISSION_MAX_IN_FLIGHT or 64  # as many submissions as may be handled at once
+)
 
 
 def validate_email(email):
@@ -60,6 +95,103 @@ def get_session_user(token):
     return sessions.get(token)
 
 
+def portfolio_access_allowed():
+    """Portfolio endpoints take a user session or the configured admin token"""
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+    if ADMIN_TOKEN and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return True
+    return get_session_user(token) is not None
+
+
+def request_caller():
+    """Return (phone_number, authenticated) for the current request"""
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+    phone_number = get_session_user(token)
+    if phone_number:
+        return phone_number, True
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get("phone_number"), str):
+        return canonicalize_phone_number(data["phone_number"].strip()), False
+    return None, False
+
+
+if TRAFFIC_CAPTURE_FILE:
+    TrafficCapture(app, TRAFFIC_CAPTURE_FILE, request_caller)
+
+access_log = None
+if ACCESS_LOG != "off":
+    access_log_stream = sys.stdout if ACCESS_LOG == "-" else open(ACCESS_LOG, "a")
+    access_log = AccessLog(app, access_log_stream, request_caller, salt=ACCESS_LOG_SALT)
+
+# Registered after the capture and access log hooks so shed requests are logged
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT) if ADMISSION_MAX_IN_FLIGHT > 0 else None
+if admission is not None:
+    app.wsgi_app = ArrivalStamp(app.wsgi_app)
+
+
+def request_queued_for():
+    """Seconds since the request arrived: at the front proxy if it says so, else at the app"""
+    waited = time.monotonic() - request.environ.get(ArrivalStamp.ENVIRON_KEY, time.monotonic())
+    if ADMISSION_REQUEST_START_HEADER:
+        proxy_waited = parse_request_start(request.headers.get(ADMISSION_REQUEST_START_HEADER))
+        if proxy_waited is not None:
+            waited = max(waited, proxy_waited)
+    return waited
+
+
+@app.before_request
+def admit_request():
+    """Shed requests early with 503 when the server is saturated"""
+    if admission is None or request.method == "OPTIONS":
+        return None
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    priority = ROUTE_PRIORITIES.get(route, "normal")
+    if not admission.admit(route, priority, request_queued_for()):
+        response = jsonify({"error": "Server busy, please retry later"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(admission.retry_after())
+        return response
+    g.admitted = (route, priority, time.monotonic())
+    return None
+
+
+@app.teardown_request
+def release_admission(exc):
+    admitted = g.pop("admitted", None)
+    if admitted is not None:
+        route, priority, started = admitted
+        admission.release(route, priority, time.monotonic() - started)
+
+
+@app.after_request
+def compress_response(response):
+    """Answer conditional GETs with 304 and compress bodies the client accepts"""
+    if response.status_code < 200 or response.status_code in (204, 304) or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    if not response.is_streamed and response.status_code == 200 and request.method in ("GET", "HEAD"):
+        # Weak, so the same tag stays valid for every encoding of the body
+        response.add_etag(weak=True)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding)
+        response.direct_passthrough = False
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
 @app.route("/")
 def home():
     return jsonify({
@@ -72,9 +204,9 @@ def home():
 def request_otp():
     """Request OTP for phone number"""
     data = request.get_json()
-    phone_number = data.get("phone_number", "").strip()
+    phone_number = canonicalize_phone_number(data.get("phone_number", "").strip())
     
-    if not validate_phone_number(phone_number):
+    if not phone_number:
         return jsonify({"error": "Invalid phone number format"}), 400
     
     # Store OTP (in real app, this would send SMS)
@@ -90,10 +222,10 @@ def request_otp():
 def verify_otp():
     """Verify OTP and create session"""
     data = request.get_json()
-    phone_number = data.get("phone_number", "").strip()
+    phone_number = canonicalize_phone_number(data.get("phone_number", "").strip())
     otp = data.get("otp", "").strip()
     
-    if not validate_phone_number(phone_number):
+    if not phone_number:
         return jsonify({"error": "Invalid phone number format"}), 400
     
     # OTP is not case-sensitive, should be stricter
@@ -103,6 +235,9 @@ def verify_otp():
     
     # Create session
     session_token = str(uuid.uuid4())
+    if NODE_ID:
+        # Lets the cluster router send the token back to the node holding the session
+        session_token = f"{NODE_ID}.{session_token}"
     sessions[session_token] = phone_number
     
     # Initialize user if doesn't exist
@@ -133,6 +268,7 @@ def get_application_status():
     if not application:
         return jsonify({"has_application": False}), 200
     
+    g.application_id = application["id"]
     return jsonify({
         "has_application": True,
         "application": application
@@ -148,6 +284,26 @@ def submit_application():
     if not phone_number:
         return jsonify({"error": "Unauthorized"}), 401
     
+    # Retries carrying the same Idempotency-Key replay the first response
+    idempotency_key = request.headers.get("Idempotency-Key", "").strip()
+    if not idempotency_key:
+        return process_application(phone_number)
+    
+    def run():
+        response = app.make_response(process_application(phone_number))
+        return response.get_data(), response.status_code, response.mimetype
+    
+    (body, status, mimetype), replayed = idempotency_cache.execute(
+        (phone_number, idempotency_key), run
+    )
+    response = Response(body, status=status, mimetype=mimetype)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def process_application(phone_number):
+    """Validate, decide and store an application for an authenticated user"""
     # Check if application already exists
     if phone_number in applications:
         # Should prevent duplicate submissions
@@ -227,6 +383,15 @@ def submit_application():
         # Some edge cases fall through without proper handling
         decision_status = "approved"
     
+    decision_reason = "Automated decision based on initial criteria"
+    check_results = external_checks.evaluate({
+        "national_id": national_id,
+        "full_name": full_name,
+        "date_of_birth": date_of_birth,
+        "loan_amount": loan_amount
+    })
+    decision_status, decision_reason = external_checks.decide(decision_status, decision_reason, check_results)
+    
     # Create application record
     application = {
         "id": str(uuid.uuid4()),
@@ -240,10 +405,13 @@ def submit_application():
         "purpose": purpose,
         "status": decision_status,
         "submitted_at": datetime.datetime.now().isoformat(),
-        "decision_reason": "Automated decision based on initial criteria"
+        "decision_reason": decision_reason
     }
+    if external_checks.checks:
+        application["external_checks"] = check_results
     
-    applications[phone_number] = application
+    portfolio.put(applications, phone_number, application)
+    g.application_id = application["id"]
     
     return jsonify({
         "message": "Application submitted successfully",
@@ -251,6 +419,34 @@ def submit_application():
     }), 201
 
 
+@app.route("/api/portfolio/aggregates", methods=["GET"])
+def get_portfolio_aggregates():
+    """Get live portfolio counters without scanning applications"""
+    if not portfolio_access_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(portfolio.snapshot()), 200
+
+
+@app.route("/api/portfolio/aggregates/check", methods=["POST"])
+def check_portfolio_aggregates():
+    """Rebuild counters from the application store and report any drift"""
+    if not portfolio_access_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    drifted = portfolio.rebuild(applications)
+    return jsonify({
+        "consistent": not drifted,
+        "aggregates": portfolio.snapshot()
+    }), 200
+
+
+@app.route("/api/admission", methods=["GET"])
+def get_admission_stats():
+    """In-flight requests, queueing delay and shed counts per route"""
+    if admission is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(admission.snapshot(), enabled=True)), 200
+
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
@@ -0,0 +1,63 @@
+import json
+import threading
+import time
+
+from flask import g, request
+
+from hashing import keyed_hash, new_salt
+
+
+def payload_shape(data):
+    """Describe a JSON payload by its keys and value types, never its values"""
+    if isinstance(data, dict):
+        return {key: payload_shape(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [payload_shape(data[0])] if data else []
+    if data is None:
+        return "null"
+    return type(data).__name__
+
+
+class TrafficCapture:
+    """Opt-in recorder of sanitized request metadata to a JSONL file
+
+    Each line holds the route, timing, status and payload shape of one
+    request, plus salted hashes of the caller's phone number and of any
+    Idempotency-Key, so a replay can keep each caller's requests (request
+    OTP, verify, submit...) in order and retry with the same key, without
+    the capture containing any personal data.
+    """
+
+    def __init__(self, app, path, caller_of):
+        self.path = path
+        self.caller_of = caller_of
+        self._salt = new_salt()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+        self._started = time.monotonic()
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+    def _before(self):
+        g.capture_started = time.monotonic()
+
+    def _after(self, response):
+        started = g.pop("capture_started", None)
+        if started is None or request.url_rule is None:
+            return response
+        phone_number, authenticated = self.caller_of()
+        record = {
+            "t": round(started - self._started, 6),
+            "method": request.method,
+            "route": request.url_rule.rule,
+            "status": response.status_code,
+            "duration_ms": round((time.monotonic() - started) * 1000, 3),
+            "actor": keyed_hash(self._salt, phone_number),
+            "authenticated": authenticated,
+            "idempotency_key": keyed_hash(self._salt, request.headers.get("Idempotency-Key")),
+            "payload": payload_shape(request.get_json(silent=True)),
+        }
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+        return response
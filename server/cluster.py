@@ -0,0 +1,439 @@
+"""
+Cluster mode: several API nodes behind a consistent-hash router.
+
+Each node is an ordinary app.py process owning the users, sessions and
+applications of the phone numbers that hash to it. The router forwards
+/api/auth/* by the canonical phone number in the body and
+/api/application/* by the node id embedded in the session token, reusing
+keep-alive connections to each node.
+
+Usage:
+    python cluster.py run --nodes 3 [--port 5001] [--base-port 5101]
+"""
+import argparse
+import bisect
+import datetime
+import hashlib
+import hmac
+import http.client
+import http.server
+import io
+import json
+import os
+import queue
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import urllib.parse
+
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+from aggregates import merge_snapshots
+from phone import canonicalize_phone_number
+
+VIRTUAL_NODES = 128  # ring points per node, to even out the hash ranges
+LISTEN_BACKLOG = 128  # as Werkzeug; socketserver's default of 5 resets connections under load
+# Safe to send again if a reused connection drops before the response arrives
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to node ids"""
+
+    def __init__(self, node_ids, virtual_nodes=VIRTUAL_NODES):
+        points = sorted(
+            (ring_hash(f"{node_id}#{replica}"), node_id)
+            for node_id in node_ids
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._node_ids = [node_id for _, node_id in points]
+
+    def owner(self, key):
+        """Return the node id owning key"""
+        index = bisect.bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._node_ids[index]
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one node, reused across requests"""
+
+    def __init__(self, host, port, max_idle=64, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(max_idle)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request and return (status, headers, body)
+
+        If a reused connection turns out to be closed, the request is sent
+        again on another one, unless it may already have been processed:
+        a request that was fully sent is only repeated when it is
+        idempotent or carries an Idempotency-Key.
+        """
+        headers = headers or {}
+        repeatable = method in IDEMPOTENT_METHODS or any(key.lower() == "idempotency-key" for key in headers)
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                reused = False
+            sent = False
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused and (not sent or repeatable):
+                    continue  # the node dropped an idle connection; try another
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                try:
+                    self._idle.put_nowait(connection)
+                except queue.Full:
+                    connection.close()
+            return response.status, response.getheaders(), data
+
+
+def create_router(nodes, admin_token):
+    """Build the router app for nodes, a dict of node_id -> (host, port)
+
+    admin_token is the nodes' ADMIN_TOKEN; the router presents it when it
+    asks every node for portfolio data.
+    """
+    router = Flask(__name__)
+    CORS(router)
+    ring = HashRing(list(nodes))
+    pools = {node_id: ConnectionPool(host, port) for node_id, (host, port) in nodes.items()}
+    fallback = next(iter(nodes))
+
+    def owner_of_request():
+        # Session tokens issued in cluster mode look like "node-1.<uuid>"
+        token = request.headers.get("Authorization", "").replace("Bearer ", "")
+        node_id = token.partition(".")[0]
+        if node_id in pools:
+            return node_id
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get("phone_number"), str):
+            phone_number = canonicalize_phone_number(data["phone_number"].strip())
+            if phone_number:
+                return ring.owner(phone_number)
+        # Nothing to route on: any node rejects the request the same way
+        return fallback
+
+    def forward(node_id):
+        headers = {
+            key: value for key, value in request.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS
+        }
+        try:
+            status, response_headers, body = pools[node_id].request(
+                request.method, request.full_path.rstrip("?"), request.get_data(), headers
+            )
+        except OSError:
+            return jsonify({"error": "Node unavailable"}), 502
+        response_headers = [
+            (key, value) for key, value in response_headers
+            if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() not in ("server", "date")
+        ]
+        return Response(body, status=status, headers=response_headers)
+
+    def fan_out(method, path):
+        """Send the same request to every node and return their JSON bodies"""
+        results = []
+        for node_id, pool in pools.items():
+            status, _, body = pool.request(method, path, headers={"Authorization": f"Bearer {admin_token}"})
+            if status != 200:
+                raise OSError(f"{node_id} answered {status}")
+            results.append(json.loads(body))
+        return results
+
+    @router.route("/api/auth/<path:rest>", methods=["GET", "POST"])
+    @router.route("/api/application/<path:rest>", methods=["GET", "POST"])
+    def proxy(rest):
+        return forward(owner_of_request())
+
+    @router.route("/")
+    def home():
+        return forward(fallback)
+
+    def portfolio_access_allowed():
+        """The admin token, or a session that its own node accepts"""
+        authorization = request.headers.get("Authorization", "")
+        token = authorization.replace("Bearer ", "")
+        if hmac.compare_digest(token.encode(), admin_token.encode()):
+            return True
+        node_id = token.partition(".")[0]
+        if node_id not in pools:
+            return False
+        status, _, _ = pools[node_id].request(
+            "GET", "/api/portfolio/aggregates", headers={"Authorization": authorization}
+        )
+        return status == 200
+
+    @router.route("/api/portfolio/aggregates", methods=["GET"])
+    def get_portfolio_aggregates():
+        try:
+            if not portfolio_access_allowed():
+                return jsonify({"error": "Unauthorized"}), 401
+            snapshots = fan_out("GET", "/api/portfolio/aggregates")
+        except OSError:
+            return jsonify({"error": "Node unavailable"}), 502
+        return jsonify(merge_snapshots(snapshots)), 200
+
+    @router.route("/api/portfolio/aggregates/check", methods=["POST"])
+    def check_portfolio_aggregates():
+        try:
+            if not portfolio_access_allowed():
+                return jsonify({"error": "Unauthorized"}), 401
+            checks = fan_out("POST", "/api/portfolio/aggregates/check")
+        except OSError:
+            return jsonify({"error": "Node unavailable"}), 502
+        return jsonify({
+            "consistent": all(check["consistent"] for check in checks),
+            "aggregates": merge_snapshots([check["aggregates"] for check in checks])
+        }), 200
+
+    @router.route("/api/admission", methods=["GET"])
+    def get_admission_stats():
+        # Each node admits its own requests, so the stats are reported per node, not merged
+        try:
+            snapshots = fan_out("GET", "/api/admission")
+        except OSError:
+            return jsonify({"error": "Node unavailable"}), 502
+        return jsonify({"nodes": dict(zip(pools, snapshots))}), 200
+
+    @router.route("/api/health", methods=["GET"])
+    def health_check():
+        down = []
+        for node_id, pool in pools.items():
+            try:
+                status, _, _ = pool.request("GET", "/api/health")
+            except OSError:
+                status = None
+            if status != 200:
+                down.append(node_id)
+        return jsonify({
+            "status": "degraded" if down else "healthy",
+            "nodes": len(pools),
+            "nodes_down": down,
+            "timestamp": datetime.datetime.now().isoformat()
+        }), 503 if down else 200
+
+    return router
+
+
+class KeepAliveWSGIHandler(http.server.BaseHTTPRequestHandler):
+    """Minimal HTTP/1.1 WSGI handler that keeps connections open
+
+    Werkzeug's development server closes every connection, which would
+    defeat the router's connection pools, so nodes and the router are
+    served with this instead. Responses are buffered and always sent with
+    a Content-Length.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def read_body(self):
+        """Read the request body, de-chunking it if needed; None if it can't be read
+
+        Whatever is left unread would be parsed as the next request on the
+        kept-alive connection, so unreadable bodies close the connection.
+        """
+        transfer_encoding = self.headers.get("Transfer-Encoding", "").strip().lower()
+        if not transfer_encoding:
+            try:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            except ValueError:
+                self.close_connection = True
+                self.send_error(400, "Bad Content-Length")
+                return None
+        if transfer_encoding != "chunked":
+            self.close_connection = True
+            self.send_error(501, "Unsupported Transfer-Encoding")
+            return None
+
+        chunks = []
+        try:
+            while True:
+                size = int(self.rfile.readline(1024).split(b";")[0], 16)
+                if size == 0:
+                    break
+                chunks.append(self.rfile.read(size))
+                if self.rfile.readline(1024) != b"\r\n":
+                    raise ValueError("chunk not terminated by CRLF")
+            while self.rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                pass  # trailers
+        except ValueError:
+            self.close_connection = True
+            self.send_error(400, "Bad chunked body")
+            return None
+        return b"".join(chunks)
+
+    def run_wsgi(self):
+        body = self.read_body()
+        if body is None:
+            return
+        path, _, query = self.path.partition("?")
+        environ = {
+            "REQUEST_METHOD": self.command,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": urllib.parse.unquote(path, "latin-1"),
+            "QUERY_STRING": query,
+            "CONTENT_TYPE": self.headers.get("Content-Type", ""),
+            "CONTENT_LENGTH": str(len(body)),
+            "SERVER_NAME": self.server.server_name,
+            "SERVER_PORT": str(self.server.server_port),
+            "SERVER_PROTOCOL": self.request_version,
+            "REMOTE_ADDR": self.client_address[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for key, value in self.headers.items():
+            name = "HTTP_" + key.upper().replace("-", "_")
+            # The body is already de-chunked; Werkzeug would otherwise read it as a stream
+            if name not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH", "HTTP_TRANSFER_ENCODING"):
+                environ[name] = f"{environ[name]},{value}" if name in environ else value
+
+        started = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return chunks.append
+
+        result = self.server.app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        data = b"".join(chunks)
+
+        status, headers = started
+        code, _, reason = status.partition(" ")
+        self.send_response(int(code), reason)
+        for key, value in headers:
+            if key.lower() not in ("content-length", "connection", "transfer-encoding", "date", "server"):
+                self.send_header(key, value)
+        if code not in ("204", "304"):  # bodiless; a 304 may not claim length 0
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = run_wsgi
+
+    def log_message(self, format, *args):
+        pass  # requests are already in the structured access log
+
+
+class ClusterHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+def serve(wsgi_app, host, port):
+    """Serve wsgi_app with a thread per connection and keep-alive"""
+    server = ClusterHTTPServer((host, port), KeepAliveWSGIHandler)
+    server.app = wsgi_app
+    server.serve_forever()
+
+
+def serve_node(args):
+    os.environ["NODE_ID"] = args.node_id
+    import app
+    serve(app.app, args.host, args.port)
+
+
+def wait_until_healthy(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request("GET", "/api/health")
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def run_cluster(args):
+    nodes = {f"node-{index}": ("127.0.0.1", args.base_port + index) for index in range(args.nodes)}
+    # Shared by the nodes so the router can read every node's portfolio
+    admin_token = os.environ.get("ADMIN_TOKEN") or secrets.token_urlsafe(32)
+    processes = [
+        subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "node",
+            "--node-id", node_id, "--host", host, "--port", str(port),
+        ], env=dict(os.environ, ADMIN_TOKEN=admin_token))
+        for node_id, (host, port) in nodes.items()
+    ]
+    # Stop the nodes too when the router is terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for node_id, (host, port) in nodes.items():
+            if not wait_until_healthy(host, port):
+                sys.exit(f"{node_id} did not start on port {port}")
+        print(f"Routing {len(nodes)} nodes on http://{args.host}:{args.port}", flush=True)
+        serve(create_router(nodes, admin_token), args.host, args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="start N nodes and the router")
+    run_parser.add_argument("--nodes", type=int, default=3)
+    run_parser.add_argument("--host", default="0.0.0.0")
+    run_parser.add_argument("--port", type=int, default=5001, help="router port")
+    run_parser.add_argument("--base-port", type=int, default=5101, help="first node port")
+    run_parser.set_defaults(func=run_cluster)
+
+    node_parser = commands.add_parser("node", help="serve a single node")
+    node_parser.add_argument("--node-id", required=True)
+    node_parser.add_argument("--host", default="127.0.0.1")
+    node_parser.add_argument("--port", type=int, required=True)
+    node_parser.set_defaults(func=serve_node)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+
+PASS = "pass"
+FAIL = "fail"
+REVIEW = "review"
+UNAVAILABLE = "unavailable"  # timed out, errored or circuit open
+
+
+class HTTPCheck:
+    """External check (credit bureau, fraud screen...) behind an HTTP endpoint
+
+    POSTs the applicant as JSON and expects {"result": "pass"|"fail"|"review"}.
+    """
+
+    def __init__(self, name, url, timeout):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+
+    def run(self, applicant):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(applicant).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read()).get("result")
+        if result not in (PASS, FAIL, REVIEW):
+            raise ValueError(f"Unexpected result from {self.name}: {result!r}")
+        return result
+
+
+class CircuitBreaker:
+    """Stop calling a dependency after repeated failures, then probe it again
+
+    Opens after failure_threshold consecutive failures; after reset_timeout
+    seconds a single probe call is let through and closes the circuit again
+    if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ExternalCheckStage:
+    """Run every external check concurrently and fold the results into a decision
+
+    Each check gets its own timeout, results are cached per national ID for
+    cache_ttl seconds, and each check has a circuit breaker. The worker pool
+    runs every check of `concurrency` submissions at once; a call still
+    queued behind it when its timeout is up is cancelled, and does not count
+    against the dependency's breaker.
+    """
+
+    def __init__(self, checks, cache_ttl=300, max_cache_entries=100000, failure_threshold=5, reset_timeout=30,
+                 concurrency=4):
+        self.checks = checks
+        self.cache_ttl = cache_ttl
+        self.max_cache_entries = max_cache_entries
+        self.breakers = {check.name: CircuitBreaker(failure_threshold, reset_timeout) for check in checks}
+        self._cache = {}  # (check name, national_id) -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, concurrency) * max(1, len(checks)), thread_name_prefix="external-check"
+        )
+
+    @classmethod
+    def from_config(cls, config, timeout, **kwargs):
+        """Build from "name=url,name=url" (an empty string disables the stage)"""
+        checks = []
+        for entry in filter(None, (part.strip() for part in config.split(","))):
+            name, _, url = entry.partition("=")
+            checks.append(HTTPCheck(name.strip(), url.strip(), timeout))
+        return cls(checks, **kwargs)
+
+    def _cached(self, name, national_id):
+        with self._lock:
+            entry = self._cache.get((name, national_id))
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._cache[(name, national_id)]
+                return None
+            return result
+
+    def _call(self, check, applicant, started):
+        started.append(time.monotonic())
+        result = check.run(applicant)
+        with self._lock:
+            self._cache[(check.name, applicant["national_id"])] = (time.monotonic() + self.cache_ttl, result)
+            while len(self._cache) > self.max_cache_entries:
+                del self._cache[next(iter(self._cache))]
+        return result
+
+    def evaluate(self, applicant):
+        """Return {check name: result} for the applicant"""
+        results = {}
+        pending = []
+        for check in self.checks:
+            cached = self._cached(check.name, applicant["national_id"])
+            if cached is not None:
+                results[check.name] = cached
+            elif not self.breakers[check.name].allow():
+                results[check.name] = UNAVAILABLE
+            else:
+                started = []
+                pending.append((check, started, self._executor.submit(self._call, check, applicant, started)))
+
+        submitted = time.monotonic()
+        for check, started, future in pending:
+            results[check.name] = self._result(check, future, started, submitted)
+        return results
+
+    def _result(self, check, future, started, submitted):
+        """Wait for one check's answer, timing it from when its call started"""
+        breaker = self.breakers[check.name]
+        wait([future], timeout=max(0, submitted + check.timeout - time.monotonic()))
+        if future.cancel():
+            return UNAVAILABLE  # never left the queue: not the dependency's fault
+        if not future.done():
+            call_started = started[0] if started else time.monotonic()
+            wait([future], timeout=max(0, call_started + check.timeout - time.monotonic()))
+        if not future.done() or future.exception() is not None:
+            # Slow or failed calls count against the breaker; a late answer still gets cached
+            breaker.record_failure()
+            return UNAVAILABLE
+        breaker.record_success()
+        return future.result()
+
+    def decide(self, status, reason, results):
+        """Fold check results into the automated (status, reason)"""
+        failed = sorted(name for name, result in results.items() if result == FAIL)
+        if failed:
+            return "rejected", f"Declined by external checks: {', '.join(failed)}"
+        referred = sorted(name for name, result in results.items() if result != PASS)
+        if referred:
+            return "pending", f"Referred for review by external checks: {', '.join(referred)}"
+        return status, reason
@@ -0,0 +1,19 @@
+import hashlib
+import hmac
+import os
+
+
+def new_salt():
+    """Random salt for one process; hashes made with it cannot be linked to another run"""
+    return os.urandom(16)
+
+
+def keyed_hash(salt, value):
+    """Shortened HMAC-SHA256 of value, or None for an empty value
+
+    Phone numbers have few enough possible values to brute-force a plain
+    hash, so personal values are only ever hashed keyed with a secret salt.
+    """
+    if not value:
+        return None
+    return hmac.new(salt, value.encode(), hashlib.sha256).hexdigest()[:16]
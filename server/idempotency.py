@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """Bounded TTL cache of completed responses with in-flight coalescing.
+
+    The first caller for a key runs the work; concurrent callers for the same
+    key wait for it and receive the stored result instead of running it again.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=24 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._in_flight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        """Return the stored result for key, dropping it if expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return None
+        return result
+
+    def _store(self, key, result, now):
+        """Store result for key, evicting the oldest entries past the bound"""
+        self._entries[key] = (now + self.ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def execute(self, key, func):
+        """Run func once per key and return (result, replayed)"""
+        while True:
+            with self._lock:
+                result = self._get(key, time.monotonic())
+                if result is not None:
+                    return result, True
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._in_flight[key] = event
+                    break
+            # Another request owns this key; if it fails nothing is stored
+            # and we loop round to run the work ourselves.
+            event.wait()
+
+        try:
+            result = func()
+            with self._lock:
+                self._store(key, result, time.monotonic())
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+        return result, False
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,38 @@
+import functools
+import sys
+
+DEFAULT_COUNTRY_CODE = "256"  # applied to local numbers
+NATIONAL_NUMBER_LENGTH = 9  # Ugandan numbers without the trunk 0, e.g. 700000004
+PHONE_CACHE_SIZE = 65536
+
+
+def validate_phone_number(phone):
+    """Validate phone number format"""
+    # Basic validation - should be digits and have reasonable length
+    if not phone:
+        return False
+    # Remove common prefixes and spaces
+    cleaned = phone.replace("+", "").replace(" ", "").replace("-", "")
+    return cleaned.isdigit() and len(cleaned) >= 9 and len(cleaned) <= 15
+
+
+@functools.lru_cache(maxsize=PHONE_CACHE_SIZE)
+def canonicalize_phone_number(phone):
+    """Normalize a phone number to the E.164-style key used by every store
+
+    "+256 700 000 004", "256700000004", "00256700000004", "0700000004"
+    and "700000004" all become "+256700000004". A leading "00" is the
+    international prefix; a single leading "0", or a bare 9-digit number,
+    is a local number. Returns None for numbers that fail validation.
+    """
+    if not validate_phone_number(phone):
+        return None
+    international = phone.lstrip().startswith("+")
+    digits = phone.replace("+", "").replace(" ", "").replace("-", "")
+    if digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = DEFAULT_COUNTRY_CODE + digits[1:]
+    elif not international and len(digits) == NATIONAL_NUMBER_LENGTH:
+        digits = DEFAULT_COUNTRY_CODE + digits
+    return sys.intern("+" + digits)
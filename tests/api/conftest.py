@@ -1,9 +1,12 @@
+import os
 import pytest
 import requests
+import sys
 import uuid
 import random
 
 BASE_URL = "http://localhost:5001"
+SERVER_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "server")
 
 
 @pytest.fixture
@@ -63,3 +66,26 @@ def valid_application_data():
         "purpose": "Business expansion and working capital"
     }
 
+
+
+@pytest.fixture(scope="session")
+def server_module(tmp_path_factory):
+    """The server app imported in-process, with its access log in a temporary file"""
+    os.environ["ACCESS_LOG"] = str(tmp_path_factory.mktemp("logs") / "access.jsonl")
+    sys.path.insert(0, SERVER_DIR)
+    import app
+    return app
+
+
+@pytest.fixture
+def local_session(server_module, unique_phone):
+    """
+    Log in against the in-process app
+    Returns: tuple of (test_client, auth_headers, phone_number)
+    """
+    client = server_module.app.test_client()
+    client.post("/api/auth/request-otp", json={"phone_number": unique_phone})
+    response = client.post("/api/auth/verify-otp", json={"phone_number": unique_phone, "otp": "0000"})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.get_json()['session_token']}"}
+    return client, headers, unique_phone
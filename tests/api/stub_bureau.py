@@ -0,0 +1,91 @@
+"""
+Stub credit bureau for exercising the external-check stage locally.
+
+Answers POST /<anything> with {"result": ...} chosen by the national ID:
+  FAIL...   -> fail
+  REVIEW... -> review
+  SLOW...   -> pass after --slow-delay seconds
+  ERROR...  -> HTTP 500
+  otherwise -> pass (after --delay seconds)
+
+Run it next to the server:
+    python stub_bureau.py --port 5301
+    EXTERNAL_CHECKS=credit_bureau=http://localhost:5301/credit python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubBureauHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        national_id = json.loads(self.rfile.read(length) or b"{}").get("national_id", "")
+        with self.server.lock:
+            self.server.calls += 1
+
+        if national_id.startswith("ERROR"):
+            self.send_error(500)
+            return
+        if national_id.startswith("SLOW"):
+            time.sleep(self.server.slow_delay)
+        elif self.server.delay:
+            time.sleep(self.server.delay)
+
+        if national_id.startswith("FAIL"):
+            result = "fail"
+        elif national_id.startswith("REVIEW"):
+            result = "review"
+        else:
+            result = "pass"
+        body = json.dumps({"result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubBureauServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 64  # concurrent evaluations connect at once
+
+    def handle_error(self, request, client_address):
+        pass  # callers that timed out hang up before the reply
+
+
+def start_stub_bureau(port=0, delay=0.0, slow_delay=2.0):
+    """Serve the stub on a background thread; returns the server (see .url, .calls)"""
+    server = StubBureauServer(("127.0.0.1", port), StubBureauHandler)
+    server.delay = delay
+    server.slow_delay = slow_delay
+    server.calls = 0
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=5301)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="seconds for SLOW... national IDs")
+    args = parser.parse_args()
+    server = start_stub_bureau(args.port, args.delay, args.slow_delay)
+    print(f"Stub bureau on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from access_log import AccessLog  # noqa: E402
+
+FIELDS = {"ts", "method", "route", "status", "latency_ms", "phone_hash", "application_id"}
+
+
+class RecordingStream:
+    """Stream that keeps each write separately; writes wait while `blocked` is set"""
+
+    def __init__(self):
+        self.writes = []
+        self.blocked = threading.Event()
+
+    def write(self, text):
+        while self.blocked.is_set():
+            time.sleep(0.01)
+        self.writes.append(text)
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return [json.loads(line) for text in self.writes for line in text.splitlines()]
+
+
+def make_log(**kwargs):
+    """A minimal app with an AccessLog writing to a RecordingStream"""
+    app = Flask(__name__)
+
+    @app.route("/ping")
+    def ping():
+        return jsonify({"ok": True})
+
+    stream = RecordingStream()
+    log = AccessLog(app, stream, lambda: ("+256700000004", False), **kwargs)
+    return app.test_client(), log, stream
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestAccessLog:
+
+    def test_records_from_the_app(self, server_module, local_session, valid_application_data):
+        """Submit and status should be logged with every field, a phone hash and the application id"""
+        client, headers, phone = local_session
+        submitted = client.post("/api/application/submit", json=valid_application_data, headers=headers)
+        assert submitted.status_code == 201
+        client.get("/api/application/status", headers=headers)
+        assert server_module.access_log.flush(timeout=5)
+
+        phone_hash = server_module.access_log.phone_hash(phone)
+        assert phone_hash and phone_hash != phone and phone[1:] not in phone_hash
+        with open(os.environ["ACCESS_LOG"]) as log:
+            text = log.read()
+        assert phone not in text
+        records = [json.loads(line) for line in text.splitlines()]
+        mine = {record["route"]: record for record in records if record["phone_hash"] == phone_hash}
+
+        application_id = submitted.get_json()["application"]["id"]
+        for route, method, status in [("/api/application/submit", "POST", 201),
+                                      ("/api/application/status", "GET", 200)]:
+            record = mine[route]
+            assert set(record) == FIELDS
+            assert record["method"] == method
+            assert record["status"] == status
+            assert record["latency_ms"] >= 0
+            assert record["application_id"] == application_id
+
+
+    def test_random_salt_when_unset(self):
+        """Without ACCESS_LOG_SALT each log gets its own salt, so hashes cannot be precomputed"""
+        _, first, _ = make_log()
+        _, second, _ = make_log()
+        assert first.phone_hash("+256700000004") != second.phone_hash("+256700000004")
+        _, salted, _ = make_log(salt="secret")
+        _, same_salt, _ = make_log(salt="secret")
+        assert salted.phone_hash("+256700000004") == same_salt.phone_hash("+256700000004")
+
+
+    def test_batches_and_flush(self):
+        """Records are written in full batches; flush() writes the partial one"""
+        client, log, stream = make_log(batch_size=3, flush_interval=60)
+        for _ in range(7):
+            client.get("/ping")
+
+        assert wait_for(lambda: len(stream.writes) == 2)
+        assert [len(text.splitlines()) for text in stream.writes] == [3, 3]
+        assert log.flush(timeout=5)
+        assert [len(text.splitlines()) for text in stream.writes] == [3, 3, 1]
+        assert len(stream.lines()) == 7
+
+
+    def test_full_queue_drops_and_counts(self):
+        """With the writer stuck, records beyond the queue size are dropped, not waited for"""
+        client, log, stream = make_log(batch_size=1, flush_interval=0, max_queue=2)
+        stream.blocked.set()
+        start = time.monotonic()
+        for _ in range(6):
+            assert client.get("/ping").status_code == 200
+        assert time.monotonic() - start < 1.0
+        assert log.dropped >= 3
+
+        stream.blocked.clear()
+        assert log.flush(timeout=5)
+        assert len(stream.lines()) + log.dropped == 6
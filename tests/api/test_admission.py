@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from admission import AdmissionController, parse_request_start  # noqa: E402
+
+
+def fill(controller, count, priority="normal"):
+    for _ in range(count):
+        assert controller.admit("/busy", priority)
+
+
+class TestAdmission:
+
+    def test_low_priority_shed_at_its_share(self):
+        """OTP requests may only fill half the shared capacity; status has its own slots"""
+        controller = AdmissionController(max_in_flight=10)
+        fill(controller, 5)
+        assert controller.admit("/api/auth/request-otp", "low") is False
+        assert controller.admit("/api/application/submit", "normal") is True
+        assert controller.admit("/api/application/status", "critical") is True
+
+
+    def test_normal_priority_waits_briefly_then_sheds(self):
+        """Normal requests wait up to their limit for a slot before being shed"""
+        controller = AdmissionController(max_in_flight=10)
+        fill(controller, 10)
+        start = time.monotonic()
+        assert controller.admit("/api/application/submit", "normal") is False
+        assert 0.05 < time.monotonic() - start < 0.5
+
+
+    def test_critical_slots_reserved(self):
+        """Critical requests are admitted while normal work fills max_in_flight, up to their own slots"""
+        controller = AdmissionController(max_in_flight=4, critical_slots=2)
+        fill(controller, 4)
+        fill(controller, 2, "critical")
+        threading.Timer(0.1, controller.release, args=("/busy", "critical", 0.1)).start()
+        start = time.monotonic()
+        assert controller.admit("/api/health", "critical") is True
+        assert time.monotonic() - start >= 0.05
+        assert controller.snapshot()["critical_in_flight"] == 2
+
+
+    def test_wait_counted_from_arrival(self):
+        """Time queued before reaching the app counts: late requests are shed though slots are free"""
+        controller = AdmissionController(max_in_flight=10)
+        assert controller.admit("/api/application/submit", "normal", waited=0.2) is False
+        assert controller.admit("/api/application/status", "critical", waited=0.2) is True
+        assert controller.admit("/api/application/status", "critical", waited=1.5) is False
+        assert controller.queue_delay.current(time.monotonic()) > 0.05
+
+
+    def test_low_priority_shed_while_queueing_delay_high(self):
+        """Low-priority requests are shed on arrival while queues are building"""
+        controller = AdmissionController(max_in_flight=10, target_delay=0.05)
+        controller.queue_delay.add(0.5, time.monotonic())
+        assert controller.admit("/api/auth/request-otp", "low") is False
+        assert controller.admit("/api/application/submit", "normal") is True
+        assert controller.retry_after() >= 1
+
+
+    def test_snapshot_tracks_routes(self):
+        """Per-route in-flight, admitted and shed counts are reported"""
+        controller = AdmissionController(max_in_flight=2)
+        fill(controller, 1, "critical")
+        fill(controller, 1)
+        controller.admit("/api/auth/request-otp", "low")
+        controller.admit("/api/auth/request-otp", "low")
+
+        snapshot = controller.snapshot()
+        assert snapshot["in_flight"] == 1
+        assert snapshot["critical_in_flight"] == 1
+        assert snapshot["routes"]["/busy"]["in_flight"] == 2
+        assert snapshot["routes"]["/api/auth/request-otp"]["admitted"] == 0
+        assert snapshot["routes"]["/api/auth/request-otp"]["shed"] == 2
+
+        controller.release("/busy", "normal", 0.01)
+        assert controller.admit("/api/auth/request-otp", "low") is True
+        assert controller.snapshot()["routes"]["/api/auth/request-otp"]["admitted"] == 1
+
+
+class TestRequestStart:
+
+    def test_units_and_prefix(self):
+        """Seconds, milliseconds and microseconds since the epoch, with or without t="""
+        now = 1_700_000_000.5
+        assert parse_request_start("t=1700000000.3", now) == pytest.approx(0.2)
+        assert parse_request_start("1700000000300", now) == pytest.approx(0.2)
+        assert parse_request_start("t=1700000000300000", now) == pytest.approx(0.2)
+
+
+    def test_missing_bad_or_future(self):
+        """Unusable stamps are ignored and a clock ahead of ours never gives a negative wait"""
+        assert parse_request_start(None) is None
+        assert parse_request_start("t=soon") is None
+        for value in ("t=inf", "1e400", "-inf", "t=nan"):
+            assert parse_request_start(value) is None, value
+        assert parse_request_start(f"t={time.time() + 5}") == 0.0
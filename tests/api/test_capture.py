@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from capture import TrafficCapture, payload_shape  # noqa: E402
+from phone import canonicalize_phone_number  # noqa: E402
+
+APPLICATION = {
+    "phone_number": "+256 700 123 456",
+    "full_name": "Jane Secret",
+    "national_id": "CM99887766",
+    "email": "jane.secret@example.com",
+    "date_of_birth": "1987-03-09",
+    "loan_amount": 123456,
+    "loan_term": 45,
+    "purpose": "Private purpose",
+}
+
+
+def caller_of():
+    data = request.get_json(silent=True) or {}
+    return canonicalize_phone_number(data.get("phone_number", "")), False
+
+
+@pytest.fixture
+def captured(tmp_path):
+    """A minimal app with capture on; returns (test_client, read_records, path)"""
+    app = Flask(__name__)
+    path = tmp_path / "capture.jsonl"
+    TrafficCapture(app, str(path), caller_of)
+
+    @app.route("/api/application/submit", methods=["POST"])
+    def submit():
+        return jsonify({"ok": True}), 201
+
+    def records():
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    return app.test_client(), records, path
+
+
+class TestPayloadShape:
+
+    def test_values_replaced_by_types(self):
+        """Only keys and value types survive"""
+        shape = payload_shape({"name": "Jane", "amount": 5, "rate": 1.5, "ok": True,
+                               "none": None, "items": [{"id": 1}], "empty": []})
+        assert shape == {"name": "str", "amount": "int", "rate": "float", "ok": "bool",
+                         "none": "null", "items": [{"id": "int"}], "empty": []}
+
+
+class TestTrafficCapture:
+
+    def test_no_values_or_phone_numbers_recorded(self, captured):
+        """The JSONL should hold the request's shape but none of its values"""
+        client, records, path = captured
+        response = client.post("/api/application/submit", json=APPLICATION,
+                               headers={"Idempotency-Key": "key-4f1c9a"})
+        assert response.status_code == 201
+
+        text = path.read_text()
+        # Numbers are covered by the payload check below; short digit runs can occur inside hashes
+        strings = [value for value in APPLICATION.values() if isinstance(value, str)]
+        for value in strings + ["+256700123456", "256700123456", "700123456", "key-4f1c9a"]:
+            assert value not in text, value
+
+        record, = records()
+        assert record["route"] == "/api/application/submit"
+        assert record["status"] == 201
+        assert record["payload"] == payload_shape(APPLICATION)
+        assert len(record["actor"]) == 16
+
+
+    def test_idempotency_key_hashed_consistently(self, captured):
+        """A retry with the same key records the same hash; other keys differ"""
+        client, records, _ = captured
+        for key in ("key-a", "key-a", "key-b"):
+            client.post("/api/application/submit", json=APPLICATION, headers={"Idempotency-Key": key})
+        client.post("/api/application/submit", json=APPLICATION)
+
+        first, retry, other, without = [record["idempotency_key"] for record in records()]
+        assert first == retry
+        assert first != other
+        assert without is None
+
+
+    def test_same_caller_same_actor(self, captured):
+        """Formats of one phone number map to one actor, other numbers to another"""
+        client, records, _ = captured
+        for phone in ("+256700123456", "0700123456", "+256700999999"):
+            client.post("/api/application/submit", json={"phone_number": phone})
+
+        first, same, other = [record["actor"] for record in records()]
+        assert first == same
+        assert first != other
@@ -0,0 +1,310 @@
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import socketserver
+import sys
+import threading
+
+import pytest
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from aggregates import merge_snapshots  # noqa: E402
+from cluster import ClusterHTTPServer, ConnectionPool, HashRing, KeepAliveWSGIHandler, create_router  # noqa: E402
+
+SERVER_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "server")
+ADMIN_TOKEN = "test-cluster-admin"
+
+
+@pytest.fixture
+def echo_server():
+    """A node-style server whose app echoes the request body; yields its port"""
+    app = Flask(__name__)
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return jsonify({"body": request.get_data(as_text=True)})
+
+    server = ClusterHTTPServer(("127.0.0.1", 0), KeepAliveWSGIHandler)
+    server.app = app
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def exchange(port, raw):
+    """Send raw bytes and return everything received until the server closes"""
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as connection:
+        connection.sendall(raw)
+        received = b""
+        while chunk := connection.recv(65536):
+            received += chunk
+    return received
+
+
+def post(body_headers, body):
+    return b"POST /echo HTTP/1.1\r\nHost: test\r\n" + body_headers + b"\r\n" + body
+
+
+CLOSE = b"GET /missing HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n"
+
+
+class TestKeepAliveWSGIHandler:
+
+    def test_content_length_body(self, echo_server):
+        received = exchange(echo_server, post(b"Content-Length: 5\r\n", b"hello") + CLOSE)
+        assert b'{"body":"hello"}' in received
+        assert received.count(b"HTTP/1.1 ") == 2
+
+    def test_chunked_body_decoded(self, echo_server):
+        """Chunks are joined and the next request on the connection is read intact"""
+        chunked = b"5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\nX-Trailer: 1\r\n\r\n"
+        received = exchange(echo_server, post(b"Transfer-Encoding: chunked\r\n", chunked) + CLOSE)
+        assert b'{"body":"hello, world"}' in received
+        assert b"HTTP/1.1 404" in received
+
+    def test_bad_bodies_close_the_connection(self, echo_server):
+        for headers, body, status in [
+            (b"Transfer-Encoding: chunked\r\n", b"zz\r\n", b"400"),
+            (b"Transfer-Encoding: gzip\r\n", b"", b"501"),
+        ]:
+            received = exchange(echo_server, post(headers, body) + CLOSE)
+            assert received.startswith(b"HTTP/1.1 " + status)
+            assert received.count(b"HTTP/1.1 ") == 1
+
+
+class DroppingNode(socketserver.ThreadingTCPServer):
+    """Answers the first request on each connection, then reads the next one and hangs up
+
+    Like a node that processed a request but closed before replying.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.requests = []
+        super().__init__(("127.0.0.1", 0), self.Handler)
+
+    class Handler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            for answer in (True, False):
+                request_line = self.rfile.readline().decode().strip()
+                if not request_line:
+                    return
+                length = 0
+                while (line := self.rfile.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                self.rfile.read(length)
+                self.server.requests.append(request_line.split()[0])
+                if answer:
+                    self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+
+
+@pytest.fixture
+def dropping_node():
+    server = DroppingNode()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestConnectionPool:
+
+    def test_idempotent_request_retried_on_dropped_connection(self, dropping_node):
+        """A GET lost on a closed keep-alive connection is sent again on a new one"""
+        pool = ConnectionPool("127.0.0.1", dropping_node.server_address[1])
+        assert pool.request("GET", "/first")[0] == 200
+        assert pool.request("GET", "/again")[0] == 200
+        assert dropping_node.requests == ["GET", "GET", "GET"]
+
+
+    def test_post_not_resent_once_delivered(self, dropping_node):
+        """A submit the node may have processed must not be sent twice"""
+        pool = ConnectionPool("127.0.0.1", dropping_node.server_address[1])
+        assert pool.request("GET", "/first")[0] == 200
+        with pytest.raises(http.client.RemoteDisconnected):
+            pool.request("POST", "/api/application/submit", b"{}")
+        assert dropping_node.requests == ["GET", "POST"]
+
+
+    def test_post_with_idempotency_key_retried(self, dropping_node):
+        """With an Idempotency-Key the node replays instead of repeating, so resending is safe"""
+        pool = ConnectionPool("127.0.0.1", dropping_node.server_address[1])
+        assert pool.request("GET", "/first")[0] == 200
+        status, _, _ = pool.request("POST", "/api/application/submit", b"{}", {"Idempotency-Key": "key-1"})
+        assert status == 200
+        assert dropping_node.requests == ["GET", "POST", "POST"]
+
+
+def start_server(wsgi_app):
+    """Serve wsgi_app the way cluster.py does, on a free port; returns the server"""
+    server = ClusterHTTPServer(("127.0.0.1", 0), KeepAliveWSGIHandler)
+    server.app = wsgi_app
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_node(node_id):
+    """A separate copy of the server app, as started by `cluster.py node`"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("NODE_ID", node_id)
+        patch.setenv("ACCESS_LOG", "off")
+        patch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+        spec = importlib.util.spec_from_file_location(f"cluster_test_{node_id}", os.path.join(SERVER_DIR, "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+def call(port, method, path, payload=None, token=None):
+    """Send one request and return (status, JSON body)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    connection.request(method, path, body=json.dumps(payload) if payload is not None else None, headers=headers)
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return response.status, data
+
+
+def login(port, phone_number):
+    call(port, "POST", "/api/auth/request-otp", {"phone_number": phone_number})
+    status, data = call(port, "POST", "/api/auth/verify-otp", {"phone_number": phone_number, "otp": "0000"})
+    assert status == 200
+    return data["session_token"]
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def cluster():
+    """Two in-process nodes behind a router; yields (router port, {node_id: app module}, ring)"""
+    modules = {node_id: load_node(node_id) for node_id in ("node-0", "node-1")}
+    servers = {node_id: start_server(module.app) for node_id, module in modules.items()}
+    nodes = {node_id: ("127.0.0.1", server.server_port) for node_id, server in servers.items()}
+    router = start_server(create_router(nodes, ADMIN_TOKEN))
+    yield router.server_port, modules, HashRing(list(nodes))
+    for server in [router, *servers.values()]:
+        server.shutdown()
+        server.server_close()
+
+
+class TestHashRing:
+
+    def test_owner_stable_and_balanced(self):
+        """Keys map to the same node every time and spread roughly evenly"""
+        ring = HashRing(["node-0", "node-1", "node-2"])
+        keys = [f"+2567{index:08d}" for index in range(3000)]
+        owners = [ring.owner(key) for key in keys]
+        assert owners == [HashRing(["node-0", "node-1", "node-2"]).owner(key) for key in keys]
+        for node_id in ("node-0", "node-1", "node-2"):
+            assert 700 < owners.count(node_id) < 1300
+
+
+    def test_adding_a_node_moves_only_its_share(self):
+        """Only keys taken over by the new node change owner"""
+        before = HashRing(["node-0", "node-1"])
+        after = HashRing(["node-0", "node-1", "node-2"])
+        keys = [f"+2567{index:08d}" for index in range(3000)]
+        moved = [key for key in keys if before.owner(key) != after.owner(key)]
+        assert all(after.owner(key) == "node-2" for key in moved)
+        assert 700 < len(moved) < 1300
+
+
+class TestMergeSnapshots:
+
+    def test_counts_summed_and_averages_recomputed(self):
+        """Counts add up per key and loan terms are sorted numerically with fresh averages"""
+        left = {"total_applications": 2, "by_status": {"approved": 2}, "by_age_band": {"25-34": 2},
+                "by_loan_term": {"30": {"count": 2, "total_amount": 3000.0, "average_amount": 1500.0}}}
+        right = {"total_applications": 2, "by_status": {"pending": 2}, "by_age_band": {"25-34": 1, "60+": 1},
+                 "by_loan_term": {"30": {"count": 1, "total_amount": 6000.0, "average_amount": 6000.0},
+                                  "15": {"count": 1, "total_amount": 1000.0, "average_amount": 1000.0}}}
+        merged = merge_snapshots([left, right])
+        assert merged["total_applications"] == 4
+        assert merged["by_status"] == {"approved": 2, "pending": 2}
+        assert merged["by_age_band"] == {"25-34": 3, "60+": 1}
+        assert list(merged["by_loan_term"]) == ["15", "30"]
+        assert merged["by_loan_term"]["30"] == {"count": 3, "total_amount": 9000.0, "average_amount": 3000.0}
+
+
+class TestRouter:
+
+    def test_phone_formats_reach_the_same_node(self, cluster):
+        """Logins in different formats of one number land on the node owning its canonical form"""
+        port, _, ring = cluster
+        digits = f"{random.randint(0, 10 ** 8 - 1):08d}"
+        international = login(port, f"+256 7{digits[:2]} {digits[2:5]} {digits[5:]}")
+        local = login(port, f"07{digits}")
+        owner = ring.owner(f"+2567{digits}")
+        assert international.partition(".")[0] == owner
+        assert local.partition(".")[0] == owner
+
+
+    def test_submit_status_and_merged_aggregates(self, cluster, valid_application_data):
+        """Requests follow the session's node, and aggregates merge every node's counters"""
+        port, modules, _ = cluster
+        _, before = call(port, "GET", "/api/portfolio/aggregates", token=ADMIN_TOKEN)
+        token = login(port, f"+2567{random.randint(0, 10 ** 8 - 1):08d}")
+        node = modules[token.partition(".")[0]]
+
+        status, submitted = call(port, "POST", "/api/application/submit", valid_application_data, token)
+        assert status == 201
+        status, data = call(port, "GET", "/api/application/status", token=token)
+        assert status == 200
+        assert data["application"]["id"] == submitted["application"]["id"]
+        assert any(app["id"] == data["application"]["id"] for app in node.applications.values())
+
+        status, after = call(port, "GET", "/api/portfolio/aggregates", token=token)
+        assert status == 200
+        assert after["total_applications"] == before["total_applications"] + 1
+        assert after == merge_snapshots([module.portfolio.snapshot() for module in modules.values()])
+        status, check = call(port, "POST", "/api/portfolio/aggregates/check", token=ADMIN_TOKEN)
+        assert status == 200
+        assert check["consistent"] is True
+
+
+    def test_nothing_to_route_on_goes_to_fallback(self, cluster):
+        """Without a token or phone number any node rejects the request the same way"""
+        port, _, _ = cluster
+        status, data = call(port, "POST", "/api/auth/verify-otp", {})
+        assert status == 400
+        assert "error" in data
+        assert call(port, "GET", "/api/application/status", token="node-9.unknown")[0] == 401
+
+
+    def test_portfolio_needs_auth(self, cluster):
+        """Anonymous and forged session tokens are refused before any node is asked"""
+        port, _, _ = cluster
+        assert call(port, "GET", "/api/portfolio/aggregates")[0] == 401
+        assert call(port, "POST", "/api/portfolio/aggregates/check", token="node-0.forged")[0] == 401
+
+
+class TestRouterNodeDown:
+
+    def test_unreachable_node_gives_502(self):
+        """Forwarded and fanned-out requests report a dead node as 502"""
+        router = create_router({"node-0": ("127.0.0.1", free_port())}, ADMIN_TOKEN).test_client()
+        response = router.post("/api/auth/request-otp", json={"phone_number": "+256700000001"})
+        assert response.status_code == 502
+        response = router.get("/api/portfolio/aggregates", headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+        assert response.status_code == 502
+        assert router.get("/api/admission").status_code == 502
+        assert router.get("/api/health").status_code == 503
@@ -0,0 +1,104 @@
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from compression import compress, compress_chunks, negotiate  # noqa: E402
+
+BASE_URL = "http://localhost:5001"
+
+ENCODERS = {"zstd": None, "br": None, "gzip": None}
+
+
+class TestNegotiation:
+
+    def test_prefers_server_order_on_ties(self):
+        """With equal q-values the server's preferred coding wins"""
+        assert negotiate("gzip, br, zstd", ENCODERS) == "zstd"
+        assert negotiate("gzip, br", ENCODERS) == "br"
+
+
+    def test_client_weights_win(self):
+        """A higher client q-value beats the server's preference"""
+        assert negotiate("zstd;q=0.5, gzip", ENCODERS) == "gzip"
+        assert negotiate("gzip;q=0, br;q=0.1", ENCODERS) == "br"
+
+
+    def test_wildcard_and_exclusions(self):
+        """'*' covers unlisted codings; q=0 and unknown codings are ignored"""
+        assert negotiate("*", ENCODERS) == "zstd"
+        assert negotiate("zstd;q=0, *", ENCODERS) == "br"
+        assert negotiate("deflate, identity", ENCODERS) is None
+        assert negotiate("", ENCODERS) is None
+
+
+    def test_unavailable_codings_skipped(self):
+        """Codings without their optional library installed are never picked"""
+        assert negotiate("br, zstd, gzip;q=0.5", {"gzip": None}) == "gzip"
+
+
+class TestStreaming:
+
+    def test_chunks_decodable_as_they_arrive(self):
+        """Every compressed chunk should decode to its input without the rest of the stream"""
+        chunks = [b'{"applications": [', b'{"id": 1}', b", ", b'{"id": 2}', b"]}"]
+        decoder = zlib.decompressobj(31)
+        for chunk, compressed in zip(chunks, compress_chunks(iter(chunks), "gzip")):
+            assert decoder.decompress(compressed) == chunk
+
+
+    def test_streamed_body_matches_whole_body(self):
+        """A streamed body should decode to the same bytes as a one-shot compression"""
+        chunks = [f'{{"id": {n}, "status": "pending"}}\n'.encode() for n in range(1000)]
+        streamed = b"".join(compress_chunks(iter(chunks), "gzip"))
+        assert zlib.decompress(streamed, 31) == b"".join(chunks)
+        assert zlib.decompress(compress(b"".join(chunks), "gzip"), 31) == b"".join(chunks)
+
+
+class TestCompressedResponses:
+
+    def test_status_compressed_when_accepted(self, authenticated_session, valid_application_data):
+        """The full application record should go out gzipped, with Vary set"""
+        session, _ = authenticated_session
+        data = valid_application_data.copy()
+        data["purpose"] = "Restocking a retail shop before the holiday season. " * 10
+        session.post(f"{BASE_URL}/api/application/submit", json=data)
+
+        response = session.get(f"{BASE_URL}/api/application/status",
+                               headers={"Accept-Encoding": "gzip"}, stream=True)
+        raw = response.raw.read(decode_content=False)
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        plain = zlib.decompress(raw, 31)
+        assert len(raw) < len(plain)
+        assert b'"has_application":true' in plain.replace(b" ", b"")
+
+
+    def test_identity_when_not_accepted(self, authenticated_session, valid_application_data):
+        """Clients that do not accept a compressed coding get the plain body"""
+        session, _ = authenticated_session
+        session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data)
+        response = session.get(f"{BASE_URL}/api/application/status", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert response.json()["has_application"] is True
+
+
+    def test_small_responses_not_compressed(self, api_client):
+        """Bodies under the size threshold are not worth compressing"""
+        response = api_client.get(f"{BASE_URL}/api/health", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+
+
+    def test_conditional_get_returns_304(self, authenticated_session, valid_application_data):
+        """An unchanged status answers If-None-Match with 304 and no body"""
+        session, _ = authenticated_session
+        session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data)
+        first = session.get(f"{BASE_URL}/api/application/status")
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        response = session.get(f"{BASE_URL}/api/application/status", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
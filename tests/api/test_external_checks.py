@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from external_checks import ExternalCheckStage, HTTPCheck  # noqa: E402
+from stub_bureau import start_stub_bureau  # noqa: E402
+
+
+@pytest.fixture
+def bureau():
+    """Stub bureau running in-process for the duration of a test"""
+    server = start_stub_bureau(slow_delay=1.0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_stage(bureau, names=("credit_bureau",), timeout=0.5, **kwargs):
+    checks = [HTTPCheck(name, f"{bureau.url}/{name}", timeout) for name in names]
+    return ExternalCheckStage(checks, **kwargs)
+
+
+def applicant(national_id):
+    return {"national_id": national_id, "full_name": "John Doe", "date_of_birth": "1990-01-15", "loan_amount": 50000}
+
+
+def evaluate_concurrently(stage, count):
+    """Evaluate `count` applicants at once, like concurrent submissions; returns their results"""
+    results = [None] * count
+
+    def evaluate(index):
+        results[index] = stage.evaluate(applicant(f"CM{index:08d}"))
+
+    threads = [threading.Thread(target=evaluate, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [result["credit_bureau"] for result in results]
+
+
+class TestExternalChecks:
+
+    def test_passing_checks_keep_decision(self, bureau):
+        """When every check passes the automated decision stands"""
+        stage = make_stage(bureau, names=("credit_bureau", "fraud"))
+        results = stage.evaluate(applicant("CM12345678"))
+        assert results == {"credit_bureau": "pass", "fraud": "pass"}
+        assert stage.decide("approved", "Automated", results) == ("approved", "Automated")
+
+
+    def test_failed_check_rejects(self, bureau):
+        """A failing check should reject the application"""
+        stage = make_stage(bureau)
+        status, reason = stage.decide("approved", "Automated", stage.evaluate(applicant("FAIL1234")))
+        assert status == "rejected"
+        assert "credit_bureau" in reason
+
+
+    def test_review_and_errors_go_to_pending(self, bureau):
+        """Review answers and unreachable checks should refer the application"""
+        stage = make_stage(bureau)
+        for national_id in ("REVIEW123", "ERROR1234"):
+            status, _ = stage.decide("approved", "Automated", stage.evaluate(applicant(national_id)))
+            assert status == "pending", national_id
+
+
+    def test_slow_check_bounded_by_timeout(self, bureau):
+        """A slow dependency should cost no more than its timeout"""
+        stage = make_stage(bureau, timeout=0.2)
+        start = time.monotonic()
+        results = stage.evaluate(applicant("SLOW1234"))
+        assert time.monotonic() - start < 0.5
+        assert results["credit_bureau"] == "unavailable"
+        assert stage.decide("approved", "Automated", results)[0] == "pending"
+
+
+    def test_checks_run_concurrently(self, bureau):
+        """Several checks should take about as long as one"""
+        bureau.delay = 0.2
+        stage = make_stage(bureau, names=("credit_bureau", "fraud", "employment"), timeout=1.0)
+        start = time.monotonic()
+        stage.evaluate(applicant("CM12345678"))
+        assert time.monotonic() - start < 0.5
+
+
+    def test_concurrent_submissions_within_timeout(self, bureau):
+        """A dependency answering within its timeout passes for every concurrent submission"""
+        bureau.delay = 0.3
+        stage = make_stage(bureau, timeout=0.5, concurrency=12)
+        assert evaluate_concurrently(stage, 12) == ["pass"] * 12
+        assert stage.breakers["credit_bureau"].failures == 0
+
+
+    def test_queued_checks_cancelled_without_tripping_breaker(self, bureau):
+        """Calls that never got a worker are cancelled and not held against the dependency"""
+        bureau.delay = 0.3
+        stage = make_stage(bureau, timeout=0.5, concurrency=1)
+        results = evaluate_concurrently(stage, 4)
+        assert results.count("pass") == 2
+        assert results.count("unavailable") == 2
+        assert stage.breakers["credit_bureau"].failures == 0
+        time.sleep(0.4)
+        assert bureau.calls == 2
+
+
+    def test_results_cached_per_national_id(self, bureau):
+        """A second evaluation for the same national ID should not call the bureau"""
+        stage = make_stage(bureau)
+        stage.evaluate(applicant("CM11111111"))
+        stage.evaluate(applicant("CM11111111"))
+        assert bureau.calls == 1
+        stage.evaluate(applicant("CM22222222"))
+        assert bureau.calls == 2
+
+
+    def test_circuit_opens_after_repeated_timeouts(self, bureau):
+        """After the failure threshold the check should be skipped entirely"""
+        stage = make_stage(bureau, timeout=0.1, failure_threshold=2, reset_timeout=60)
+        stage.evaluate(applicant("SLOW0001"))
+        stage.evaluate(applicant("SLOW0002"))
+        assert stage.breakers["credit_bureau"].state == "open"
+
+        calls = bureau.calls
+        start = time.monotonic()
+        results = stage.evaluate(applicant("CM33333333"))
+        assert time.monotonic() - start < 0.05
+        assert results["credit_bureau"] == "unavailable"
+        assert bureau.calls == calls
+
+
+    def test_circuit_closes_after_successful_probe(self, bureau):
+        """Once reset_timeout passes a successful probe should close the circuit"""
+        stage = make_stage(bureau, timeout=0.1, failure_threshold=1, reset_timeout=0.2)
+        stage.evaluate(applicant("SLOW0003"))
+        assert stage.breakers["credit_bureau"].state == "open"
+
+        time.sleep(0.25)
+        assert stage.evaluate(applicant("CM44444444"))["credit_bureau"] == "pass"
+        assert stage.breakers["credit_bureau"].state == "closed"
+
+
+class TestApplicationRecord:
+
+    def test_no_field_without_checks(self, server_module, local_session, valid_application_data, monkeypatch):
+        """With no checks configured the application has no external_checks field"""
+        monkeypatch.setattr(server_module, "external_checks", ExternalCheckStage([]))
+        client, headers, _ = local_session
+        response = client.post("/api/application/submit", json=valid_application_data, headers=headers)
+        assert response.status_code == 201
+        assert "external_checks" not in response.get_json()["application"]
+
+
+    def test_field_with_checks(self, bureau, server_module, local_session, valid_application_data, monkeypatch):
+        """Configured checks report their results on the application"""
+        monkeypatch.setattr(server_module, "external_checks", make_stage(bureau))
+        client, headers, _ = local_session
+        response = client.post("/api/application/submit", json=valid_application_data, headers=headers)
+        assert response.status_code == 201
+        assert response.get_json()["application"]["external_checks"] == {"credit_bureau": "pass"}
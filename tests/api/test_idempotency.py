@@ -0,0 +1,68 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = "http://localhost:5001"
+
+
+class TestIdempotency:
+
+    def test_retry_with_same_key_replays_first_response(self, authenticated_session, valid_application_data):
+        """Retrying with the same Idempotency-Key should return the stored response"""
+        session, phone = authenticated_session
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+        response1 = session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data, headers=headers)
+        response2 = session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data, headers=headers)
+
+        assert response1.status_code == 201
+        assert response2.status_code == 201
+        assert response2.content == response1.content
+        assert response2.headers.get("Idempotent-Replayed") == "true"
+
+
+    def test_replay_skips_validation(self, authenticated_session, valid_application_data):
+        """A replay should not re-validate the (possibly different) retried body"""
+        session, phone = authenticated_session
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+        response1 = session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data, headers=headers)
+        response2 = session.post(f"{BASE_URL}/api/application/submit", json={}, headers=headers)
+
+        assert response1.status_code == 201
+        assert response2.status_code == 201
+        assert response2.content == response1.content
+
+
+    def test_different_key_is_not_replayed(self, authenticated_session, valid_application_data):
+        """A new Idempotency-Key should run the submission again"""
+        session, phone = authenticated_session
+
+        response1 = session.post(
+            f"{BASE_URL}/api/application/submit",
+            json=valid_application_data,
+            headers={"Idempotency-Key": str(uuid.uuid4())}
+        )
+        response2 = session.post(
+            f"{BASE_URL}/api/application/submit",
+            json=valid_application_data,
+            headers={"Idempotency-Key": str(uuid.uuid4())}
+        )
+
+        assert response1.status_code == 201
+        assert response2.status_code == 400
+        assert "Idempotent-Replayed" not in response2.headers
+
+
+    def test_concurrent_duplicates_are_coalesced(self, authenticated_session, valid_application_data):
+        """Concurrent requests with the same key should all see one application"""
+        session, phone = authenticated_session
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+        def submit(_):
+            return session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data, headers=headers)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(submit, range(8)))
+
+        assert all(response.status_code == 201 for response in responses)
+        assert len({response.json()["application"]["id"] for response in responses}) == 1
@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from phone import canonicalize_phone_number  # noqa: E402
+
+BASE_URL = "http://localhost:5001"
+
+
+def authenticate(phone):
+    """Log in with the given phone number format and return an authorized session"""
+    session = requests.Session()
+    session.post(f"{BASE_URL}/api/auth/request-otp", json={"phone_number": phone})
+    response = session.post(
+        f"{BASE_URL}/api/auth/verify-otp",
+        json={"phone_number": phone, "otp": "0000"}
+    )
+    assert response.status_code == 200
+    session.headers.update({"Authorization": f"Bearer {response.json()['session_token']}"})
+    return session, response.json()["phone_number"]
+
+
+class TestPhoneNumbers:
+
+    def test_request_otp_returns_canonical_number(self, api_client):
+        """Spaced, dashed and local formats should all map to the E.164 form"""
+        digits = ''.join([str(random.randint(0, 9)) for _ in range(8)])
+        canonical = f"+2567{digits}"
+        formats = [
+            canonical,
+            f"2567{digits}",
+            f"07{digits}",
+            f"7{digits}",
+            f"002567{digits}",
+            f"00 256 7{digits}",
+            f"+256 7{digits[:2]} {digits[2:5]} {digits[5:]}",
+            f"07{digits[:2]}-{digits[2:5]}-{digits[5:]}",
+        ]
+
+        for phone in formats:
+            response = api_client.post(
+                f"{BASE_URL}/api/auth/request-otp",
+                json={"phone_number": phone}
+            )
+            assert response.status_code == 200, f"Failed for format: {phone}"
+            assert response.json()["phone_number"] == canonical
+
+
+    def test_verify_otp_accepts_different_format_than_request(self, api_client):
+        """OTP requested with one format should verify with another"""
+        digits = ''.join([str(random.randint(0, 9)) for _ in range(8)])
+        api_client.post(f"{BASE_URL}/api/auth/request-otp", json={"phone_number": f"+256 7{digits}"})
+
+        response = api_client.post(
+            f"{BASE_URL}/api/auth/verify-otp",
+            json={"phone_number": f"07{digits}", "otp": "0000"}
+        )
+        assert response.status_code == 200
+        assert response.json()["phone_number"] == f"+2567{digits}"
+
+
+    def test_formats_share_one_application(self, valid_application_data):
+        """Logging in with another format of the same number should see the same application"""
+        digits = ''.join([str(random.randint(0, 9)) for _ in range(8)])
+        session1, phone1 = authenticate(f"+256 7{digits[:2]} {digits[2:5]} {digits[5:]}")
+        session2, phone2 = authenticate(f"2567{digits}")
+        assert phone1 == phone2
+
+        response = session1.post(f"{BASE_URL}/api/application/submit", json=valid_application_data)
+        assert response.status_code == 201
+
+        response = session2.get(f"{BASE_URL}/api/application/status")
+        assert response.json()["has_application"] is True
+        assert response.json()["application"]["phone_number"] == phone1
+
+        response = session2.post(f"{BASE_URL}/api/application/submit", json=valid_application_data)
+        assert response.status_code == 400
+
+
+class TestCanonicalization:
+
+    def test_international_prefix(self):
+        """A leading 00 is the international prefix, not a local trunk 0"""
+        assert canonicalize_phone_number("00256700000004") == "+256700000004"
+        assert canonicalize_phone_number("0044 20 7946 0018") == "+442079460018"
+
+
+    def test_national_number_without_trunk_zero(self):
+        """A bare 9-digit number is local; with an explicit + it is taken as given"""
+        assert canonicalize_phone_number("700000004") == "+256700000004"
+        assert canonicalize_phone_number("700 000 004") == "+256700000004"
+        assert canonicalize_phone_number("+700000004") == "+700000004"
@@ -0,0 +1,159 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from aggregates import PortfolioAggregates  # noqa: E402
+
+BASE_URL = "http://localhost:5001"
+
+
+class TestPortfolio:
+
+    def test_aggregates_require_auth(self, api_client):
+        """Portfolio totals and the rebuild are not open to anonymous callers"""
+        assert api_client.get(f"{BASE_URL}/api/portfolio/aggregates").status_code == 401
+        response = api_client.post(
+            f"{BASE_URL}/api/portfolio/aggregates/check",
+            headers={"Authorization": "Bearer not-a-session"}
+        )
+        assert response.status_code == 401
+
+
+    def test_aggregates_shape(self, authenticated_session):
+        """Aggregates should expose status, loan term and age band breakdowns"""
+        session, phone = authenticated_session
+        response = session.get(f"{BASE_URL}/api/portfolio/aggregates")
+        assert response.status_code == 200
+        data = response.json()
+        assert "total_applications" in data
+        assert set(["approved", "pending", "rejected"]) <= set(data["by_status"])
+        assert "by_loan_term" in data
+        assert "by_age_band" in data
+
+
+    def test_submission_updates_aggregates(self, authenticated_session, valid_application_data):
+        """A new application should be counted by status, loan term and age band"""
+        session, phone = authenticated_session
+        before = session.get(f"{BASE_URL}/api/portfolio/aggregates").json()
+
+        data = valid_application_data.copy()
+        data["loan_amount"] = 45000
+        data["loan_term"] = 45
+        data["date_of_birth"] = "1990-01-01"
+        response = session.post(f"{BASE_URL}/api/application/submit", json=data)
+        assert response.status_code == 201
+        status = response.json()["application"]["status"]
+
+        after = session.get(f"{BASE_URL}/api/portfolio/aggregates").json()
+        assert after["total_applications"] == before["total_applications"] + 1
+        assert after["by_status"][status] == before["by_status"][status] + 1
+        term_before = before["by_loan_term"].get("45", {"count": 0, "total_amount": 0})
+        assert after["by_loan_term"]["45"]["count"] == term_before["count"] + 1
+        assert after["by_loan_term"]["45"]["total_amount"] == term_before["total_amount"] + 45000
+        assert after["by_age_band"]["35-44"] == before["by_age_band"].get("35-44", 0) + 1
+
+
+    def test_rejected_submission_not_counted(self, authenticated_session, valid_application_data):
+        """Validation failures should not change the aggregates"""
+        session, phone = authenticated_session
+        before = session.get(f"{BASE_URL}/api/portfolio/aggregates").json()
+
+        data = valid_application_data.copy()
+        data["loan_amount"] = 0
+        response = session.post(f"{BASE_URL}/api/application/submit", json=data)
+        assert response.status_code == 400
+
+        after = session.get(f"{BASE_URL}/api/portfolio/aggregates").json()
+        assert after["total_applications"] == before["total_applications"]
+
+
+    def test_consistency_check_matches_store(self, authenticated_session, valid_application_data):
+        """Rebuilding from the store should agree with the incremental counters"""
+        session, phone = authenticated_session
+        session.post(f"{BASE_URL}/api/application/submit", json=valid_application_data)
+
+        response = session.post(f"{BASE_URL}/api/portfolio/aggregates/check")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["consistent"] is True
+        assert data["aggregates"] == session.get(f"{BASE_URL}/api/portfolio/aggregates").json()
+
+
+class TestPortfolioStatusChanges:
+
+    def test_set_status_keeps_aggregates_consistent(self, server_module, local_session, valid_application_data):
+        """Moving a stored application to another status should keep the counters in step with the store"""
+        client, headers, phone = local_session
+        response = client.post("/api/application/submit", json=valid_application_data, headers=headers)
+        assert response.status_code == 201
+        old_status = response.get_json()["application"]["status"]
+        new_status = "rejected" if old_status != "rejected" else "approved"
+        before = client.get("/api/portfolio/aggregates", headers=headers).get_json()
+
+        server_module.portfolio.set_status(server_module.applications, phone, new_status)
+
+        after = client.get("/api/portfolio/aggregates", headers=headers).get_json()
+        assert after["total_applications"] == before["total_applications"]
+        assert after["by_status"][old_status] == before["by_status"][old_status] - 1
+        assert after["by_status"][new_status] == before["by_status"][new_status] + 1
+        assert client.get("/api/application/status", headers=headers).get_json()["application"]["status"] == new_status
+
+        check = client.post("/api/portfolio/aggregates/check", headers=headers).get_json()
+        assert check["consistent"] is True
+        assert check["aggregates"] == after
+
+
+class TestPortfolioAccess:
+
+    def test_admin_token_grants_access(self, server_module, monkeypatch):
+        """Operators can read the portfolio with ADMIN_TOKEN instead of a session"""
+        client = server_module.app.test_client()
+        monkeypatch.setattr(server_module, "ADMIN_TOKEN", "admin-secret")
+        assert client.get("/api/portfolio/aggregates", headers={"Authorization": "Bearer admin-secret"}).status_code == 200
+        assert client.get("/api/portfolio/aggregates", headers={"Authorization": "Bearer admin-guess"}).status_code == 401
+
+
+class TestRebuild:
+
+    def test_rebuild_retries_when_a_write_races_the_scan(self):
+        """A write during the lock-free scan makes rebuild() scan again rather than swap in stale counters"""
+        aggregates = PortfolioAggregates()
+        application = {"status": "approved", "loan_term": 30, "loan_amount": 1000.0,
+                       "date_of_birth": "1990-01-01", "submitted_at": "2026-01-01T00:00:00"}
+
+        class RacingStore(dict):
+            scans = 0
+
+            def values(self):
+                RacingStore.scans += 1
+                if RacingStore.scans == 1:
+                    aggregates.put(self, "+256700000002", dict(application))
+                return super().values()
+
+        store = RacingStore()
+        aggregates.put(store, "+256700000001", dict(application))
+        assert aggregates.rebuild(store) is False
+        assert RacingStore.scans == 2
+        assert aggregates.snapshot()["total_applications"] == 2
+
+
+    def test_writes_not_blocked_by_scan(self):
+        """put() completes while a rebuild is scanning"""
+        aggregates = PortfolioAggregates()
+        application = {"status": "pending", "loan_term": 15, "loan_amount": 2000.0,
+                       "date_of_birth": "1980-05-05", "submitted_at": "2026-01-01T00:00:00"}
+        put_during_scan = []
+
+        class ObservedStore(dict):
+            def values(self):
+                if not put_during_scan:
+                    writer = threading.Thread(target=aggregates.put, args=(self, "+256700000003", dict(application)))
+                    writer.start()
+                    writer.join(timeout=2)
+                    put_during_scan.append(not writer.is_alive())
+                return super().values()
+
+        assert aggregates.rebuild(ObservedStore()) is False
+        assert put_during_scan == [True]
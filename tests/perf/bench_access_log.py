@@ -0,0 +1,107 @@
+"""
+Measure request throughput with the JSON access log on and off.
+
+Each mode runs in a fresh process (the access log is configured when the
+app is imported) and drives the in-process app through its test client
+from several threads with a login/status/submit mix.
+
+Usage:
+    python bench_access_log.py [--requests 20000] [--threads 8]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server")
+
+APPLICATION = {
+    "full_name": "Bench Tester",
+    "date_of_birth": "1990-01-15",
+    "loan_amount": 45000,
+    "loan_term": 30,
+    "purpose": "Working capital",
+}
+
+
+def drive(requests_per_thread, threads):
+    """Run the workload in this process and return requests per second"""
+    sys.path.insert(0, SERVER_DIR)
+    import app as server
+
+    def worker(index):
+        client = server.app.test_client()
+        sent = 0
+        user = 0
+        while sent < requests_per_thread:
+            phone = f"+2567{index:02d}{user:06d}"
+            user += 1
+            client.post("/api/auth/request-otp", json={"phone_number": phone})
+            token = client.post(
+                "/api/auth/verify-otp", json={"phone_number": phone, "otp": "0000"}
+            ).get_json()["session_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            client.get("/api/application/status", headers=headers)
+            client.post("/api/application/submit", json=dict(APPLICATION, national_id=f"CM{phone[-8:]}"), headers=headers)
+            for _ in range(4):
+                client.get("/api/application/status", headers=headers)
+            sent += 8
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if server.access_log is not None:
+        server.access_log.flush()
+    return requests_per_thread * threads / elapsed
+
+
+def run_mode(access_log, args):
+    env = dict(os.environ, ACCESS_LOG=access_log)
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", "--requests", str(args.requests), "--threads", str(args.threads)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])["throughput"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        throughput = drive(args.requests // args.threads, args.threads)
+        print(json.dumps({"throughput": throughput}))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "access.jsonl")
+        modes = [("off", "off"), ("on (file)", log_path)]
+        results = {name: [] for name, _ in modes}
+        for _ in range(args.repeat):
+            for name, access_log in modes:
+                results[name].append(run_mode(access_log, args))
+        with open(log_path) as log:
+            logged = sum(1 for _ in log)
+
+    print(f"{args.requests:,} requests x {args.repeat} runs, {args.threads} threads")
+    print(f"{'access log':<12}{'best req/s':>12}{'mean req/s':>12}")
+    for name, values in results.items():
+        print(f"{name:<12}{max(values):>12.0f}{sum(values) / len(values):>12.0f}")
+    off, on = max(results["off"]), max(results["on (file)"])
+    print(f"\nOverhead: {(off - on) / off * 100:.1f}% ({logged:,} lines written)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Check that cluster throughput scales with the number of nodes.
+
+For each node count, starts `server/cluster.py run` on local ports, drives
+it with login/status/submit traffic from several load processes over
+keep-alive connections for a fixed duration, and reports requests per
+second, failed requests, the speed-up over one node and how applications
+were spread over the nodes. Exits 1 if any request failed, or if the
+largest cluster does not reach --min-speedup, unless the machine has too
+few CPUs for the nodes to run in parallel.
+
+Usage:
+    python bench_cluster.py [--nodes 1 2 4] [--duration 10]
+                            [--processes 4] [--threads 8] [--min-speedup 1.5]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+CLUSTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server", "cluster.py")
+HOST = "127.0.0.1"
+ADMIN_TOKEN = "bench-cluster-admin"  # given to the nodes, to read each one's portfolio
+
+APPLICATION = {
+    "full_name": "Cluster Tester",
+    "date_of_birth": "1990-01-15",
+    "loan_amount": 45000,
+    "loan_term": 30,
+    "purpose": "Working capital",
+}
+
+
+def call(connection, method, path, payload=None, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    body = json.dumps(payload).encode() if payload is not None else None
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def load_thread(port, deadline, counter):
+    """Log users in one after another and poll their status
+
+    Appends (successful requests, failed requests) to counter. A failure
+    (connection error, 5xx or unexpected body) abandons the user and
+    starts the next one on a fresh connection.
+    """
+    connection = http.client.HTTPConnection(HOST, port, timeout=30)
+    sent = errors = 0
+
+    def request(method, path, payload=None, token=None):
+        nonlocal sent
+        status, data = call(connection, method, path, payload, token)
+        if status >= 500:
+            raise http.client.HTTPException(f"{method} {path} answered {status}")
+        sent += 1
+        return data
+
+    try:
+        while time.monotonic() < deadline:
+            phone = f"+2567{random.randint(0, 10 ** 8 - 1):08d}"
+            try:
+                request("POST", "/api/auth/request-otp", {"phone_number": phone})
+                token = request("POST", "/api/auth/verify-otp", {"phone_number": phone, "otp": "0000"})["session_token"]
+                request("POST", "/api/application/submit", dict(APPLICATION, national_id=f"CM{phone[-8:]}"), token)
+                for _ in range(5):
+                    request("GET", "/api/application/status", token=token)
+            except Exception:
+                errors += 1
+                connection.close()  # reconnects on the next request
+    finally:
+        counter.append((sent, errors))
+
+
+def load_process(port, duration, threads, results):
+    random.seed()
+    deadline = time.monotonic() + duration
+    counter = []
+    workers = [threading.Thread(target=load_thread, args=(port, deadline, counter)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((sum(sent for sent, _ in counter), sum(errors for _, errors in counter)))
+
+
+def wait_until_healthy(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(HOST, port, timeout=1)
+            connection.request("GET", "/api/health")
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def measure(nodes, port, args):
+    """Start a cluster of `nodes` and return (requests/s, failed requests, applications per node)"""
+    base_port = port + 100
+    cluster = subprocess.Popen(
+        [sys.executable, CLUSTER, "run", "--nodes", str(nodes), "--host", HOST,
+         "--port", str(port), "--base-port", str(base_port)],
+        env=dict(os.environ, ACCESS_LOG="off", ADMIN_TOKEN=ADMIN_TOKEN),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_until_healthy(port):
+            sys.exit(f"Cluster of {nodes} did not start")
+        results = multiprocessing.Queue()
+        loaders = [
+            multiprocessing.Process(target=load_process, args=(port, args.duration, args.threads, results))
+            for _ in range(args.processes)
+        ]
+        start = time.monotonic()
+        for loader in loaders:
+            loader.start()
+        counts = [results.get() for _ in loaders]
+        for loader in loaders:
+            loader.join()
+        elapsed = time.monotonic() - start
+
+        spread = []
+        for index in range(nodes):
+            connection = http.client.HTTPConnection(HOST, base_port + index, timeout=5)
+            _, aggregates = call(connection, "GET", "/api/portfolio/aggregates", token=ADMIN_TOKEN)
+            spread.append(aggregates["total_applications"])
+        return sum(sent for sent, _ in counts) / elapsed, sum(errors for _, errors in counts), spread
+    finally:
+        cluster.terminate()
+        cluster.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--processes", type=int, default=4, help="load generator processes")
+    parser.add_argument("--threads", type=int, default=8, help="connections per load process")
+    parser.add_argument("--min-speedup", type=float, default=1.5, help="required speed-up of the largest cluster")
+    parser.add_argument("--port", type=int, default=5201, help="router port (nodes use port + 100...)")
+    args = parser.parse_args()
+
+    throughput = {}
+    failed = 0
+    print(f"{'nodes':>5}{'req/s':>10}{'errors':>8}{'speed-up':>10}  applications per node")
+    for nodes in sorted(args.nodes):
+        throughput[nodes], errors, spread = measure(nodes, args.port, args)
+        failed += errors
+        speedup = throughput[nodes] / throughput[min(throughput)]
+        print(f"{nodes:>5}{throughput[nodes]:>10.0f}{errors:>8}{speedup:>9.2f}x  {spread}")
+
+    if failed:
+        print(f"\n{failed} requests failed: throughput is not comparable")
+        sys.exit(1)
+
+    largest = max(throughput)
+    speedup = throughput[largest] / throughput[min(throughput)]
+    cpus = os.cpu_count() or 1
+    # Router, nodes and load generators all need a core to run in parallel
+    if cpus < largest + 2:
+        print(f"\nOnly {cpus} CPUs for {largest} nodes plus router and load: not enforcing --min-speedup")
+        return
+    if speedup < args.min_speedup:
+        print(f"\n{largest} nodes reached {speedup:.2f}x, below the required {args.min_speedup:.2f}x")
+        sys.exit(1)
+    print(f"\n{largest} nodes reached {speedup:.2f}x (required {args.min_speedup:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
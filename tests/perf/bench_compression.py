@@ -0,0 +1,94 @@
+"""
+Measure bytes on the wire and CPU cost of response compression by size.
+
+Bodies are JSON lists of application records like the ones returned by
+/api/application/status, from a few hundred bytes to a megabyte. Each
+available encoding (gzip, plus br and zstd when brotli / zstandard are
+installed) compresses them whole and streamed in --chunk-size chunks,
+the way compress_response handles generator responses.
+
+Usage:
+    python bench_compression.py [--sizes 256 1024 4096 65536 1048576]
+                                [--chunk-size 8192]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server"))
+
+from compression import ENCODERS, compress, compress_chunks  # noqa: E402
+
+
+def application(rng):
+    return {
+        "application_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "phone_number": f"+2567{rng.randrange(10 ** 8):08d}",
+        "full_name": rng.choice(["John Doe", "Jane Akello", "Peter Okello", "Mary Nakato"]),
+        "national_id": f"CM{rng.randrange(10 ** 8):08d}",
+        "email": f"user{rng.randrange(10 ** 6)}@example.com",
+        "date_of_birth": f"19{rng.randrange(60, 99)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        "loan_amount": rng.randrange(1000, 5000000),
+        "loan_term": rng.choice([15, 30, 45, 60]),
+        "purpose": rng.choice(["Working capital", "School fees", "Medical", "Farming inputs"]),
+        "status": rng.choice(["approved", "pending", "rejected"]),
+        "decision_reason": "Automated decision",
+        "submitted_at": f"2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T10:00:00",
+    }
+
+
+def body_of_size(size, rng):
+    """A JSON list of whole application records, at least `size` bytes long"""
+    records = []
+    body = b"[]"
+    while len(body) < size:
+        records.append(application(rng))
+        body = json.dumps(records, separators=(",", ":")).encode()
+    return body
+
+
+def measure(func, min_seconds):
+    """Return (result, CPU seconds per call), repeating for at least min_seconds"""
+    calls = 0
+    start = time.process_time()
+    while True:
+        result = func()
+        calls += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_seconds:
+            return result, elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 4096, 16384, 65536, 262144, 1048576])
+    parser.add_argument("--chunk-size", type=int, default=8192, help="bytes per chunk for streamed bodies")
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="CPU time to spend per measurement")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"Encodings: {', '.join(ENCODERS)} (streamed in {args.chunk_size:,} byte chunks)")
+    print(f"{'size':>9}{'encoding':>10}{'bytes':>10}{'ratio':>8}{'CPU us':>10}{'MB/s':>8}"
+          f"{'streamed':>10}{'CPU us':>10}")
+    for size in args.sizes:
+        body = body_of_size(size, rng)
+        chunks = [body[offset:offset + args.chunk_size] for offset in range(0, len(body), args.chunk_size)]
+        print(f"{len(body):>9,}{'identity':>10}{len(body):>10,}{1:>8.2f}{'-':>10}{'-':>8}{len(body):>10,}{'-':>10}")
+        for encoding in ENCODERS:
+            whole, whole_cpu = measure(lambda: compress(body, encoding), args.min_seconds)
+            streamed, streamed_cpu = measure(
+                lambda: b"".join(compress_chunks(iter(chunks), encoding)), args.min_seconds
+            )
+            print(
+                f"{'':>9}{encoding:>10}{len(whole):>10,}{len(body) / len(whole):>8.2f}"
+                f"{whole_cpu * 1e6:>10.1f}{len(body) / whole_cpu / 1e6:>8.1f}"
+                f"{len(streamed):>10,}{streamed_cpu * 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare memory and lookup cost of phone-number keyed stores.
+
+Builds a `users`-style dict at the requested size keyed by:
+  - raw client strings in mixed formats (the old behaviour, with duplicates
+    stored once per format)
+  - canonical E.164 strings from canonicalize_phone_number
+  - canonical numbers packed into ints
+
+Usage:
+    python bench_phone_keys.py [--users 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+
+from app import canonicalize_phone_number  # noqa: E402
+
+
+def raw_formats(digits):
+    """The spellings clients actually send for one number"""
+    return [
+        f"+2567{digits}",
+        f"2567{digits}",
+        f"07{digits}",
+        f"+256 7{digits[:2]} {digits[2:5]} {digits[5:]}",
+    ]
+
+
+def measure(build):
+    """Return (bytes allocated, seconds) to build a store"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    numbers = [f"{n:08d}" for n in random.sample(range(10 ** 8), args.users)]
+    requests = [random.choice(raw_formats(digits)) for digits in numbers]
+
+    canonicalize_phone_number.cache_clear()
+    start = time.perf_counter()
+    for phone in requests:
+        canonicalize_phone_number(phone)
+    cold = time.perf_counter() - start
+    hot_sample = requests[:50_000]
+    start = time.perf_counter()
+    for _ in range(10):
+        for phone in hot_sample:
+            canonicalize_phone_number(phone)
+    hot = time.perf_counter() - start
+    print(f"canonicalize (cold):  {cold / len(requests) * 1e9:8.0f} ns/call")
+    print(f"canonicalize (cached):{hot / (len(hot_sample) * 10) * 1e9:8.0f} ns/call")
+    canonicalize_phone_number.cache_clear()
+
+    def raw_store():
+        # Each user logs in with two different spellings, as mobile and web do
+        store = {}
+        for digits in numbers:
+            for phone in random.sample(raw_formats(digits), 2):
+                store[phone] = True
+        return store
+
+    def canonical_store():
+        store = {}
+        for phone in requests:
+            store[canonicalize_phone_number(phone)] = True
+        canonicalize_phone_number.cache_clear()
+        return store
+
+    def int_store():
+        store = {}
+        for phone in requests:
+            store[int(canonicalize_phone_number(phone)[1:])] = True
+        canonicalize_phone_number.cache_clear()
+        return store
+
+    print(f"\n{args.users:,} users")
+    print(f"{'keys':<12}{'entries':>12}{'MiB':>10}{'B/user':>10}{'build s':>10}")
+    for name, build in [("raw", raw_store), ("canonical", canonical_store), ("int", int_store)]:
+        entries = len(build())
+        size, elapsed = measure(build)
+        print(f"{name:<12}{entries:>12,}{size / 2 ** 20:>10.1f}{size / args.users:>10.1f}{elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
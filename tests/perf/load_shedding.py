@@ -0,0 +1,313 @@
+"""
+Load test: latency of admitted requests under overload, shedding on vs off.
+
+Starts the server twice (ADMISSION_MAX_IN_FLIGHT=0, then the configured
+limit) with --applications on file, measures the unprotected capacity
+with closed-loop clients, then offers both servers the same open-loop mix
+at --overload times that capacity: OTP requests (low priority), application
+submits and portfolio consistency checks (normal; the checks are CPU-heavy),
+and status and health checks (critical). Latency is measured from each request's scheduled send time,
+so time spent in the server's accept queue counts too; requests carry an
+X-Request-Start stamp, as from a front proxy, so the server counts that
+time as queueing delay as well. Load generators run niced so the server,
+not the generator, is the bottleneck. Exits 1 if, with admission control
+on, admitted critical requests have a worse p50 than without it, or the
+p99 of admitted critical or normal requests exceeds --max-p99-ms or
+--max-normal-p99-ms.
+
+The p99 bounds need CPUs for the server beyond the load generators; with
+fewer than --processes + 2, the generators and the server compete for the
+same cores and the bounds are reported but not enforced.
+
+Usage:
+    python load_shedding.py [--overload 3] [--duration 10]
+                            [--max-in-flight 4] [--max-p99-ms 250]
+                            [--max-normal-p99-ms 1000]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server")
+HOST = "127.0.0.1"
+ADMIN_TOKEN = "load-shedding-admin"  # lets the load generator run consistency checks
+
+# (share of traffic, method, path, priority class)
+MIX = [
+    (0.35, "POST", "/api/auth/request-otp", "low"),
+    (0.10, "POST", "/api/application/submit", "normal"),
+    (0.10, "POST", "/api/portfolio/aggregates/check", "normal"),
+    (0.35, "GET", "/api/application/status", "critical"),
+    (0.10, "GET", "/api/health", "critical"),
+]
+SUBMIT_SHARE = 0.10
+CAPACITY_APPLICANTS = 300  # logged-in users without an application, for the capacity run
+APPLICATION = {
+    "full_name": "Load Tester",
+    "email": "load@example.com",
+    "date_of_birth": "1990-01-15",
+    "loan_amount": 45000,
+    "loan_term": 30,
+    "purpose": "Working capital",
+}
+
+
+def send(port, method, path, payload=None, token=None):
+    connection = http.client.HTTPConnection(HOST, port, timeout=30)
+    # Stamped like a front proxy would, so time in the accept queue counts as queueing delay
+    headers = {"Content-Type": "application/json", "X-Request-Start": f"t={time.time():.6f}"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    connection.request(method, path, body=json.dumps(payload).encode() if payload else None, headers=headers)
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response.status, body
+
+
+def login(port, index):
+    """Log user number `index` in and return their session token"""
+    phone = f"+2567{index:08d}"
+    send(port, "POST", "/api/auth/request-otp", {"phone_number": phone})
+    _, body = send(port, "POST", "/api/auth/verify-otp", {"phone_number": phone, "otp": "0000"})
+    return json.loads(body)["session_token"]
+
+
+def submit(port, token, index):
+    return send(port, "POST", "/api/application/submit", dict(APPLICATION, national_id=f"CM{index:08d}"), token)
+
+
+def apply(port, index):
+    """Log a new user in, file an application and return their session token"""
+    token = login(port, index)
+    submit(port, token, index)
+    return token
+
+
+def issue(port, tokens, applicants):
+    """Send one request drawn from MIX; return (class, status)
+
+    Submits are filed for `applicants`, (token, index) pairs of logged-in
+    users without an application, each used once.
+    """
+    draw = random.random()
+    for share, method, path, priority in MIX:
+        draw -= share
+        if draw <= 0:
+            break
+    if path == "/api/application/submit":
+        try:
+            token, index = applicants.pop()
+        except IndexError:
+            return issue(port, tokens, applicants)  # every applicant has submitted; draw again
+        status, _ = submit(port, token, index)
+    elif path == "/api/auth/request-otp":
+        status, _ = send(port, method, path, {"phone_number": f"+2567{random.randint(0, 10 ** 8 - 1):08d}"})
+    elif path == "/api/application/status":
+        status, _ = send(port, method, path, token=random.choice(tokens))
+    elif path == "/api/portfolio/aggregates/check":
+        status, _ = send(port, method, path, token=ADMIN_TOKEN)
+    else:
+        status, _ = send(port, method, path)
+    return priority, status
+
+
+def closed_loop_process(port, tokens, applicants, duration, threads, nice, results):
+    """Report how many requests `threads` back-to-back clients complete"""
+    os.nice(nice)
+    deadline = time.monotonic() + duration
+    counts = []
+
+    def worker():
+        sent = 0
+        while time.monotonic() < deadline:
+            issue(port, tokens, applicants)
+            sent += 1
+        counts.append(sent)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.put(sum(counts))
+
+
+def open_loop_process(port, tokens, applicants, rate, duration, threads, nice, results):
+    """Offer `rate` requests/s for `duration` seconds; report per-request results"""
+    os.nice(nice)
+    random.seed()
+    start = time.monotonic() + 0.5
+    schedule = iter(start + index / rate for index in range(int(rate * duration)))
+    lock = threading.Lock()
+    observed = []
+
+    def worker():
+        while True:
+            with lock:
+                scheduled = next(schedule, None)
+            if scheduled is None:
+                return
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                priority, status = issue(port, tokens, applicants)
+            except OSError:
+                priority, status = "error", 0
+            observed.append((priority, status, time.monotonic() - scheduled))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.put(observed)
+
+
+def in_processes(target, args_per_process):
+    """Run target(*args, results) in a process per args tuple; return their results"""
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=target, args=args + (results,)) for args in args_per_process]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return collected
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def start_server(port, max_in_flight):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "run", "--host", HOST, "--port", str(port), "--no-reload"],
+        cwd=SERVER_DIR,
+        env=dict(os.environ, ACCESS_LOG="off", ADMISSION_MAX_IN_FLIGHT=str(max_in_flight),
+                 ADMISSION_REQUEST_START_HEADER="X-Request-Start", ADMIN_TOKEN=ADMIN_TOKEN),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if send(port, "GET", "/api/health")[0] == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit("Server did not start")
+
+
+def run(label, max_in_flight, args, rate=None):
+    """Overload one server configuration; return (offered rate, per-class stats)
+
+    Without a rate, the server's capacity is measured first and the offered
+    rate is --overload times that.
+    """
+    server = start_server(args.port, max_in_flight)
+    try:
+        tokens = [apply(args.port, index) for index in range(args.applications)]
+        next_index = args.applications
+
+        def applicants_per_process(count):
+            """Log in `count` new users and deal them out to the load processes"""
+            nonlocal next_index
+            applicants = [(login(args.port, index), index) for index in range(next_index, next_index + count)]
+            next_index += count
+            return [applicants[process::args.processes] for process in range(args.processes)]
+
+        if rate is None:
+            completed = in_processes(closed_loop_process, [
+                (args.port, tokens, applicants, 3, args.threads, args.nice)
+                for applicants in applicants_per_process(CAPACITY_APPLICANTS)
+            ])
+            rate = sum(completed) / 3 * args.overload
+        # Enough applicants that submits rarely run out, even with an unlucky draw
+        expected_submits = int(rate * args.duration * SUBMIT_SHARE)
+        observed = [
+            item
+            for items in in_processes(open_loop_process, [
+                (args.port, tokens, applicants, rate / args.processes, args.duration, args.threads * 16, args.nice)
+                for applicants in applicants_per_process(expected_submits * 3 // 2 + 50)
+            ])
+            for item in items
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+
+    stats = {}
+    for priority in ("critical", "normal", "low"):
+        requests = [(status, latency) for klass, status, latency in observed if klass == priority]
+        admitted = [latency * 1000 for status, latency in requests if status != 503]
+        stats[priority] = {
+            "sent": len(requests),
+            "shed": sum(1 for status, _ in requests if status == 503),
+            "p50": percentile(admitted, 0.50),
+            "p99": percentile(admitted, 0.99),
+        }
+    print(f"\n{label}: offered {rate:.0f} req/s ({args.overload:g}x the unprotected capacity)")
+    print(f"  {'class':<10}{'sent':>8}{'shed':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for priority, values in stats.items():
+        print(f"  {priority:<10}{values['sent']:>8}{values['shed']:>8}{values['p50']:>10.1f}{values['p99']:>10.1f}")
+    return rate, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--overload", type=float, default=3.0, help="offered load as a multiple of capacity")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of overload per run")
+    parser.add_argument("--applications", type=int, default=5000, help="applications on file during the run")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="ADMISSION_MAX_IN_FLIGHT for the shedding run")
+    parser.add_argument("--max-p99-ms", type=float, default=250, help="allowed p99 for admitted critical requests")
+    parser.add_argument("--max-normal-p99-ms", type=float, default=1000,
+                        help="allowed p99 for admitted normal-priority requests")
+    parser.add_argument("--threads", type=int, default=16, help="clients per process used to measure capacity")
+    parser.add_argument("--processes", type=int, default=2, help="open-loop load generator processes")
+    parser.add_argument("--nice", type=int, default=10, help="niceness of the load generators, so on small "
+                        "machines the server rather than the generator is the bottleneck")
+    parser.add_argument("--port", type=int, default=5401)
+    args = parser.parse_args()
+
+    # Offer both configurations the same rate, based on the unprotected capacity
+    rate, unprotected = run("Admission control off", 0, args)
+    _, stats = run(f"Admission control on (max {args.max_in_flight} in flight)", args.max_in_flight, args, rate)
+
+    p50, unprotected_p50 = stats["critical"]["p50"], unprotected["critical"]["p50"]
+    failed = False
+    if not p50 <= unprotected_p50:
+        print(f"\nAdmitted critical p50 {p50:.1f} ms is worse than {unprotected_p50:.1f} ms without admission control")
+        failed = True
+    else:
+        print(f"\nAdmitted critical p50 {p50:.1f} ms against {unprotected_p50:.1f} ms without admission control")
+
+    cpus = os.cpu_count() or 1
+    enforce = cpus >= args.processes + 2
+    if not enforce:
+        print(f"Only {cpus} CPUs for the server and {args.processes} load processes: "
+              "not enforcing --max-p99-ms or --max-normal-p99-ms")
+    for priority, bound in (("critical", args.max_p99_ms), ("normal", args.max_normal_p99_ms)):
+        p99 = stats[priority]["p99"]
+        if p99 <= bound:
+            print(f"Admitted {priority} p99 {p99:.1f} ms within {bound:.0f} ms")
+        else:
+            print(f"Admitted {priority} p99 {p99:.1f} ms exceeds {bound:.0f} ms")
+            failed = failed or enforce
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
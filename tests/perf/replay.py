@@ -0,0 +1,228 @@
+"""
+Replay captured traffic against a server and compare runs per route.
+
+Capture traffic by starting the server with TRAFFIC_CAPTURE_FILE set:
+    TRAFFIC_CAPTURE_FILE=capture.jsonl python app.py
+
+Replay it against a build (optionally faster than real time) and save the
+observed latencies:
+    python replay.py run capture.jsonl --output before.jsonl [--speed 10]
+
+Compare two runs, e.g. before and after a change:
+    python replay.py compare before.jsonl after.jsonl
+
+The capture holds only payload shapes, so replay synthesizes valid values
+for each captured field. Each captured caller becomes a fresh phone number
+and their requests are issued in their original order. Requests captured
+with the same Idempotency-Key are replayed with the same key, so retries
+hit the idempotency cache as they did in production.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = "http://localhost:5001"
+
+APPLICATION_VALUES = {
+    "full_name": "Replay Tester",
+    "email": "replay@example.com",
+    "date_of_birth": "1990-01-15",
+    "loan_amount": 45000,
+    "loan_term": 30,
+    "purpose": "Working capital",
+}
+
+
+class Caller:
+    """Replay-side stand-in for one captured caller"""
+
+    def __init__(self):
+        digits = ''.join([str(random.randint(0, 9)) for _ in range(8)])
+        self.phone_number = f"+2567{digits}"
+        self.national_id = f"CM{digits}"
+        self.token = None
+        self.previous = None  # Future of this caller's last request
+        self.requests = 0
+        self.idempotency_keys = {}  # captured key hash -> replay key
+
+    def idempotency_key(self, captured):
+        """The replay key for a captured key hash; retries get the same key"""
+        if captured is True:  # captures made before key hashes were recorded
+            return f"replay-{self.phone_number}-{self.requests}"
+        if captured not in self.idempotency_keys:
+            self.idempotency_keys[captured] = f"replay-{self.phone_number}-{len(self.idempotency_keys)}"
+        return self.idempotency_keys[captured]
+
+
+def synthesize(shape, caller, record):
+    """Build a payload with the captured shape out of valid values
+
+    Requests captured without a caller never had a valid phone number, so
+    they are replayed with an invalid one.
+    """
+    if not isinstance(shape, dict):
+        return None
+    payload = {}
+    for key in shape:
+        if key == "phone_number":
+            payload[key] = caller.phone_number if caller else "invalid"
+        elif key == "otp":
+            # Reproduce failed verifications with a wrong code
+            payload[key] = "0000" if record["status"] == 200 else "9999"
+        elif key == "national_id":
+            payload[key] = caller.national_id if caller else "CM00000000"
+        else:
+            payload[key] = APPLICATION_VALUES.get(key, "replay")
+    return payload
+
+
+def issue(session, base_url, record, caller):
+    """Send one captured request and return the observed result"""
+    headers = {}
+    if record.get("authenticated") and caller is not None and caller.token:
+        headers["Authorization"] = f"Bearer {caller.token}"
+    if record.get("idempotency_key") and caller is not None:
+        headers["Idempotency-Key"] = caller.idempotency_key(record["idempotency_key"])
+    payload = synthesize(record.get("payload"), caller, record)
+
+    start = time.perf_counter()
+    response = session.request(record["method"], base_url + record["route"], json=payload, headers=headers)
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    if caller is not None:
+        caller.requests += 1
+        if record["route"] == "/api/auth/verify-otp" and response.status_code == 200:
+            caller.token = response.json()["session_token"]
+    return {
+        "route": f"{record['method']} {record['route']}",
+        "status": response.status_code,
+        "captured_status": record["status"],
+        "latency_ms": round(latency_ms, 3),
+        "captured_ms": record.get("duration_ms"),
+    }
+
+
+def run(args):
+    with open(args.capture) as capture:
+        records = [json.loads(line) for line in capture if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    if not records:
+        sys.exit("Capture is empty")
+
+    random.seed(args.seed)
+    callers = defaultdict(Caller)
+    local = threading.local()
+
+    def send(record, caller, previous):
+        if previous is not None:
+            previous.result()  # keep each caller's auth flow in order
+        if not hasattr(local, "session"):
+            local.session = requests.Session()  # pooled keep-alive per worker
+        return issue(local.session, args.base_url, record, caller)
+
+    futures = []
+    origin = records[0]["t"]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for record in records:
+            delay = (record["t"] - origin) / args.speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            caller = callers[record["actor"]] if record.get("actor") else None
+            previous = caller.previous if caller else None
+            future = pool.submit(send, record, caller, previous)
+            if caller:
+                caller.previous = future
+            futures.append(future)
+        results = [future.result() for future in futures]
+    elapsed = time.monotonic() - start
+
+    with open(args.output, "w") as output:
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+
+    mismatched = sum(1 for result in results if result["status"] != result["captured_status"])
+    print(f"Replayed {len(results)} requests from {len(callers)} callers in {elapsed:.1f}s "
+          f"(speed x{args.speed:g}); {mismatched} status mismatches")
+    print_summary(summarize(results))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(results):
+    """Latency stats per route"""
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result["route"]].append(result["latency_ms"])
+    return {
+        route: {
+            "count": len(latencies),
+            "mean": statistics.fmean(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+        for route, latencies in by_route.items()
+    }
+
+
+def print_summary(summary):
+    print(f"\n  {'route':<36}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, stats in sorted(summary.items()):
+        print(f"  {route:<36}{stats['count']:>7}{stats['mean']:>9.2f}{stats['p50']:>9.2f}"
+              f"{stats['p95']:>9.2f}{stats['p99']:>9.2f}")
+
+
+def compare(args):
+    def load(path):
+        with open(path) as results:
+            return summarize([json.loads(line) for line in results if line.strip()])
+
+    before, after = load(args.before), load(args.after)
+    print(f"Latency (ms) per route: {args.before} -> {args.after}")
+    print(f"  {'route':<36}{'p50':>17}{'p95':>17}{'p99':>17}{'mean Δ%':>10}")
+    for route in sorted(set(before) | set(after)):
+        if route not in before or route not in after:
+            print(f"  {route:<36}  only in {'after' if route in after else 'before'}")
+            continue
+        b, a = before[route], after[route]
+        cells = "".join(f"{b[key]:>8.2f}→{a[key]:<8.2f}" for key in ("p50", "p95", "p99"))
+        change = (a["mean"] - b["mean"]) / b["mean"] * 100 if b["mean"] else 0.0
+        print(f"  {route:<36}{cells}{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay a capture against a server")
+    run_parser.add_argument("capture", help="JSONL file written by TRAFFIC_CAPTURE_FILE")
+    run_parser.add_argument("--output", required=True, help="where to write per-request results")
+    run_parser.add_argument("--base-url", default=BASE_URL)
+    run_parser.add_argument("--speed", type=float, default=1.0, help="time compression factor")
+    run_parser.add_argument("--workers", type=int, default=32)
+    run_parser.add_argument("--seed", type=int, help="fix the generated phone numbers")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="diff per-route latency of two runs")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Soak test: drive login/submit/status traffic and watch for memory growth.
+
+Runs the Flask app in-process through its test client against a fixed
+population of users, so once every user has logged in and applied the
+stores should stop growing. Memory is sampled periodically (RSS,
+tracemalloc and the deep size of each in-memory store) and a least-squares
+slope is fitted to the samples taken after the warm-up period. The run
+fails (exit code 1) if the total or any single store grows faster than the
+configured limit.
+
+Usage:
+    python soak.py [--duration 300] [--warmup 60] [--users 500]
+                   [--sample-interval 5] [--max-total-slope 512]
+                   [--max-store-slope 64]
+
+Slopes are in KiB per minute.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "server"))
+os.environ.setdefault("ACCESS_LOG", "off")
+
+import app as server  # noqa: E402
+
+APPLICATION = {
+    "full_name": "Soak Tester",
+    "email": "soak@example.com",
+    "date_of_birth": "1990-01-15",
+    "loan_amount": 45000,
+    "loan_term": 30,
+    "purpose": "Working capital",
+}
+
+
+def stores():
+    """The long-lived in-memory stores to watch, by name"""
+    return {
+        "users": server.users,
+        "applications": server.applications,
+        "otp_store": server.otp_store,
+        "sessions": server.sessions,
+        "idempotency_cache": server.idempotency_cache._entries,
+    }
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes held by obj and everything it references"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in list(obj.items()):
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in list(obj):
+            size += deep_sizeof(item, seen)
+    return size
+
+
+def rss_bytes():
+    """Current resident set size, or peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def slope_per_minute(samples):
+    """Least-squares slope of (seconds, bytes) samples, in bytes per minute"""
+    if len(samples) < 2:
+        return 0.0
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return 0.0
+    covariance = sum((t - mean_t) * (y - mean_y) for t, y in samples)
+    return covariance / variance * 60
+
+
+class Traffic:
+    """A fixed population of users logging in, applying and polling status"""
+
+    def __init__(self, client, users, relogin_rate):
+        self.client = client
+        self.phones = [f"+2567{n:08d}" for n in random.sample(range(10 ** 8), users)]
+        self.tokens = {}
+        self.relogin_rate = relogin_rate
+        self.requests = 0
+
+    def login(self, phone):
+        self.client.post("/api/auth/request-otp", json={"phone_number": phone})
+        response = self.client.post("/api/auth/verify-otp", json={"phone_number": phone, "otp": "0000"})
+        self.requests += 2
+        self.tokens[phone] = response.get_json()["session_token"]
+
+    def step(self):
+        """One user visit: maybe log in again, check status, apply if needed"""
+        phone = random.choice(self.phones)
+        if phone not in self.tokens or random.random() < self.relogin_rate:
+            self.login(phone)
+        headers = {"Authorization": f"Bearer {self.tokens[phone]}"}
+
+        status = self.client.get("/api/application/status", headers=headers).get_json()
+        self.requests += 1
+        if not status["has_application"]:
+            data = dict(APPLICATION, national_id=f"CM{phone[-8:]}")
+            headers["Idempotency-Key"] = f"soak-{phone}"
+            self.client.post("/api/application/submit", json=data, headers=headers)
+            self.client.get("/api/application/status", headers=headers)
+            self.requests += 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--duration", type=float, default=300, help="total seconds to run")
+    parser.add_argument("--warmup", type=float, default=60, help="seconds before steady state")
+    parser.add_argument("--users", type=int, default=500, help="size of the user population")
+    parser.add_argument("--relogin-rate", type=float, default=0.05, help="chance a visit logs in again")
+    parser.add_argument("--sample-interval", type=float, default=5, help="seconds between samples")
+    parser.add_argument("--max-total-slope", type=float, default=512, help="KiB/min allowed for RSS and tracemalloc")
+    parser.add_argument("--max-store-slope", type=float, default=64, help="KiB/min allowed per store")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    tracemalloc.start()
+    traffic = Traffic(server.app.test_client(), args.users, args.relogin_rate)
+    samples = {"rss": [], "tracemalloc": []}
+    samples.update({name: [] for name in stores()})
+    first_snapshot = None
+
+    start = time.monotonic()
+    next_sample = start
+    print(f"{'t (s)':>7}{'requests':>10}{'RSS MiB':>10}{'traced MiB':>12}  store KiB")
+    while True:
+        now = time.monotonic()
+        if now >= next_sample:
+            elapsed = now - start
+            traced, _ = tracemalloc.get_traced_memory()
+            sizes = {name: deep_sizeof(store) for name, store in stores().items()}
+            if elapsed >= args.warmup:
+                samples["rss"].append((elapsed, rss_bytes()))
+                samples["tracemalloc"].append((elapsed, traced))
+                for name, size in sizes.items():
+                    samples[name].append((elapsed, size))
+                if first_snapshot is None:
+                    first_snapshot = tracemalloc.take_snapshot()
+            print(
+                f"{elapsed:>7.0f}{traffic.requests:>10}{rss_bytes() / 2 ** 20:>10.1f}{traced / 2 ** 20:>12.1f}  "
+                + " ".join(f"{name}={size / 1024:.0f}" for name, size in sizes.items())
+            )
+            if elapsed >= args.duration:
+                break
+            next_sample += args.sample_interval
+        traffic.step()
+
+    failures = []
+    print(f"\nSlopes after {args.warmup:.0f}s warm-up (KiB/min):")
+    for name, points in samples.items():
+        slope = slope_per_minute(points) / 1024
+        limit = args.max_total_slope if name in ("rss", "tracemalloc") else args.max_store_slope
+        verdict = "FAIL" if slope > limit else "ok"
+        if slope > limit:
+            failures.append(name)
+        print(f"  {name:<18}{slope:>10.1f}  (limit {limit:.0f})  {verdict}")
+
+    if first_snapshot is not None:
+        print("\nTop allocation growth since steady state:")
+        # Leave out the harness's own bookkeeping
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        stats = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(
+            first_snapshot.filter_traces(ignore), "lineno"
+        )
+        for stat in stats[:10]:
+            print(f"  {stat}")
+
+    if failures:
+        print(f"\nMemory grew beyond the limit in: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nNo memory growth beyond the limits")
+
+
+if __name__ == "__main__":
+    main()